@@ -0,0 +1,139 @@
+"""
+Historical queries over the Parquet archive written by retention.py.
+
+Reads only ARCHIVE_DIR, never the serving database. Uses DuckDB when it
+is installed (any SQL over the `predictions` and `shadow_predictions`
+views) and falls back to pyarrow.dataset for the built-in summaries.
+
+    python analytics.py --summary --start 2025-01-01 --end 2025-03-31
+    python analytics.py "SELECT model_version, avg(raw_score) FROM predictions GROUP BY 1"
+"""
+import glob
+import os
+from datetime import date
+
+# Same default as retention.py; not imported from there so this module
+# never loads the database layer
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+TABLES = ("predictions", "shadow_predictions")
+
+
+def _glob(archive_dir, table):
+    return os.path.join(archive_dir, table, "dt=*", "*.parquet")
+
+
+def _has_files(archive_dir, table):
+    return bool(glob.glob(_glob(archive_dir, table)))
+
+# ========== DuckDB ==========
+
+def connect(archive_dir=ARCHIVE_DIR):
+    """In-memory DuckDB connection with a view per archived table (dt is a DATE column)."""
+    import duckdb
+
+    conn = duckdb.connect()
+    for table in TABLES:
+        if _has_files(archive_dir, table):
+            path = _glob(archive_dir, table).replace("'", "''")  # views can't take parameters
+            conn.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{path}', hive_partitioning = true)")
+    return conn
+
+
+def query(sql, params=None, archive_dir=ARCHIVE_DIR):
+    """Run SQL against the archive; returns (column names, rows)."""
+    conn = connect(archive_dir)
+    try:
+        cursor = conn.execute(sql, params or [])
+        return [d[0] for d in cursor.description], cursor.fetchall()
+    finally:
+        conn.close()
+
+# ========== pyarrow ==========
+
+def load(table="predictions", start=None, end=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """
+    Archived rows between `start` and `end` (inclusive dates) as a pyarrow
+    Table. Only the matching dt= partitions are opened.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if not _has_files(archive_dir, table):
+        return None
+    dataset = ds.dataset(
+        os.path.join(archive_dir, table), format="parquet",
+        partitioning=ds.partitioning(pa.schema([("dt", pa.date32())]), flavor="hive"),
+    )
+    expression = None
+    if start is not None:
+        expression = ds.field("dt") >= start
+    if end is not None:
+        upper = ds.field("dt") <= end
+        expression = upper if expression is None else expression & upper
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def daily_summary(start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """Per day/model/result counts and mean scores, via DuckDB or pyarrow."""
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        duckdb = None
+
+    if duckdb is not None:
+        if not _has_files(archive_dir, "predictions"):
+            return []
+        _, rows = query(
+            """
+            SELECT dt, model_version, prediction_result, count(*), avg(raw_score), avg(confidence_score)
+            FROM predictions
+            WHERE dt >= coalesce(?, dt) AND dt <= coalesce(?, dt)
+            GROUP BY ALL ORDER BY ALL
+            """,
+            [start, end], archive_dir,
+        )
+    else:
+        table = load("predictions", start, end,
+                     ["dt", "model_version", "prediction_result", "raw_score", "confidence_score"],
+                     archive_dir)
+        if table is None:
+            return []
+        grouped = table.group_by(["dt", "model_version", "prediction_result"]).aggregate([
+            ("raw_score", "count"), ("raw_score", "mean"), ("confidence_score", "mean"),
+        ])
+        rows = sorted(zip(*[grouped.column(c).to_pylist() for c in (
+            "dt", "model_version", "prediction_result", "raw_score_count", "raw_score_mean",
+            "confidence_score_mean")]), key=lambda r: (r[0], r[1] or "", r[2]))
+
+    return [
+        {
+            "day": day.isoformat(),
+            "model_version": version,
+            "prediction": result,
+            "count": count,
+            "mean_raw_score": round(mean_score, 4),
+            "mean_confidence": round(mean_confidence, 4),
+        }
+        for day, version, result, count, mean_score, mean_confidence in rows
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Query the archived prediction logs")
+    parser.add_argument("sql", nargs="?", help="SQL over the predictions / shadow_predictions views (DuckDB)")
+    parser.add_argument("--summary", action="store_true", help="Daily counts per model and result")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.sql:
+        names, rows = query(args.sql, archive_dir=args.archive_dir)
+        print("\t".join(names))
+        for row in rows:
+            print("\t".join(str(v) for v in row))
+    else:
+        print(json.dumps(daily_summary(args.start, args.end, args.archive_dir), indent=2))
@@ -0,0 +1,7 @@
+"""
+Load-testing and latency benchmarks for the OncoDetect API.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --mode both --concurrency 1,4,16
+"""
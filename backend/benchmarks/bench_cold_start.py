@@ -0,0 +1,135 @@
+"""
+Measure API cold start: import cost, time to first response and time to ready.
+
+    python -m benchmarks.bench_cold_start --runs 3 --output cold_start.json
+
+For each STARTUP_MODE it launches a fresh uvicorn process, polls `/` until
+the first answer arrives and `/health/ready` until it returns 200, and
+reports both from the moment the process was spawned. It also breaks down
+`import main` with `python -X importtime` so a heavy import creeping back
+onto the startup path shows up by name.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixtures import build_tiny_model, isolated_env
+from benchmarks.harness import _free_port
+from benchmarks.bench_serving import stop_mode
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ========== Import Time ==========
+
+def import_profile(env, top=10):
+    """Run `import main` under -X importtime; total seconds and its slowest direct imports."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    children = {}
+    imports = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        # Children are printed before their parent, indented two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative)
+        elif depth == 0:
+            if name.strip() == "main":
+                imports, total_us = children, int(cumulative)
+            children = {}
+    slowest = sorted(imports.items(), key=lambda item: -item[1])[:top]
+    return {
+        "total_s": round(total_us / 1e6, 3),
+        "slowest": [{"module": m, "cumulative_ms": round(us / 1000, 1)} for m, us in slowest],
+    }
+
+# ========== Startup Timing ==========
+
+def time_startup(env, mode, timeout=300):
+    """Seconds from spawn until the first answer on `/` and until `/health/ready` is 200."""
+    port = _free_port("127.0.0.1")
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**env, "STARTUP_MODE": mode},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    first_response = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while ready is None:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"{mode} server did not become ready")
+                if proc.poll() is not None:
+                    raise RuntimeError(f"{mode} server exited with code {proc.returncode}")
+                try:
+                    if first_response is None:
+                        client.get("/")
+                        first_response = time.perf_counter() - start
+                    if client.get("/health/ready").status_code == 200:
+                        ready = time.perf_counter() - start
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        stop_mode([proc])
+    return {"first_response_s": round(first_response, 3), "ready_s": round(ready, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per startup mode")
+    parser.add_argument("--modes", default="blocking,background")
+    parser.add_argument("--model", help="Model file to serve (default: tiny stand-in model)")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="oncodetect-coldstart-")
+    env = {
+        **os.environ,
+        **isolated_env(workdir),
+        "MODEL_PATH": os.path.abspath(args.model) if args.model
+                      else build_tiny_model(os.path.join(workdir, "tiny_model.h5")),
+    }
+
+    imports = import_profile(env)
+    print(f"📦 import main: {imports['total_s']*1000:.0f}ms")
+    for entry in imports["slowest"]:
+        print(f"  {entry['module']:<24s} {entry['cumulative_ms']:8.1f}ms")
+
+    report = {"runs": args.runs, "import": imports, "modes": {}}
+    for mode in filter(None, args.modes.split(",")):
+        runs = [time_startup(env, mode) for _ in range(args.runs)]
+        summary = {
+            "first_response_s": statistics.median(r["first_response_s"] for r in runs),
+            "ready_s": statistics.median(r["ready_s"] for r in runs),
+            "runs": runs,
+        }
+        report["modes"][mode] = summary
+        print(f"🏁 {mode:<10s} first response {summary['first_response_s']:.2f}s, "
+              f"ready {summary['ready_s']:.2f}s (median of {args.runs})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
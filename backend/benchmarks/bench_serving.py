@@ -0,0 +1,173 @@
+"""
+Compare per-worker model serving with the shared-memory inference server.
+
+    python -m benchmarks.bench_serving --workers 4 --concurrency 4,16 --output serving.json
+
+Starts real uvicorn processes for each mode, drives /predict over HTTP and
+reports throughput, latency and the memory of the whole process tree
+(RSS, plus PSS where the kernel provides it so shared pages aren't counted
+once per worker).
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixtures import build_tiny_model, isolated_env, make_synthetic_image
+from benchmarks.harness import _free_port, run_load
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ========== Process Memory ==========
+
+def _children(pid):
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(c) for c in f.read().split())
+        except FileNotFoundError:
+            pass
+    return children
+
+
+def _memory_kb(pid, field, path):
+    try:
+        with open(path.format(pid=pid)) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return 0
+
+
+def tree_memory_mb(root_pids):
+    """Total RSS and PSS (MB) of the given processes and all their descendants."""
+    seen = set()
+    stack = list(root_pids)
+    rss = pss = 0
+    while stack:
+        pid = stack.pop()
+        if pid in seen or not os.path.exists(f"/proc/{pid}"):
+            continue
+        seen.add(pid)
+        rss += _memory_kb(pid, "VmRSS", "/proc/{pid}/status")
+        pss += _memory_kb(pid, "Pss", "/proc/{pid}/smaps_rollup")
+        stack.extend(_children(pid))
+    return {"processes": len(seen), "rss_mb": round(rss / 1024, 1), "pss_mb": round(pss / 1024, 1)}
+
+# ========== Launchers ==========
+
+def start_mode(mode, workers, port, env):
+    """Start the processes for one serving mode; returns the Popen handles."""
+    procs = []
+    if mode == "shared":
+        procs.append(subprocess.Popen(
+            [sys.executable, "inference_server.py", "--rings", str(workers)],
+            cwd=BACKEND_DIR, env=env,
+        ))
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**env, "SERVING_MODE": mode},
+    ))
+    return procs
+
+
+def stop_mode(procs):
+    for proc in reversed(procs):
+        proc.send_signal(signal.SIGTERM)
+    for proc in procs:
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def wait_ready(base_url, workers, timeout=300):
+    """Wait until readiness succeeds enough times in a row to have hit every worker."""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while streak < workers * 4:
+            if time.monotonic() > deadline:
+                raise TimeoutError("Server did not become ready")
+            try:
+                response = await client.get("/health/ready")
+                streak = streak + 1 if response.status_code == 200 else 0
+            except httpx.HTTPError:
+                streak = 0
+            await asyncio.sleep(0.1 if streak == 0 else 0.01)
+
+
+async def measure(base_url, concurrency_levels, total_requests):
+    payload = make_synthetic_image((64, 64))
+    request_kwargs = lambda i: {"files": {"file": (f"bench_{i}.png", payload, "image/png")}}
+    results = []
+    limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        for concurrency in concurrency_levels:
+            summary = await run_load(client, "POST", "/predict", concurrency, total_requests, request_kwargs)
+            results.append({"concurrency": concurrency, **summary})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-worker vs shared-memory serving benchmark")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", default="4,16")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--model", help="Model file to serve (default: tiny stand-in model)")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c]
+    workdir = tempfile.mkdtemp(prefix="oncodetect-serving-")
+    env = {
+        **os.environ,
+        **isolated_env(workdir),
+        "MODEL_PATH": os.path.abspath(args.model) if args.model
+                      else build_tiny_model(os.path.join(workdir, "tiny_model.h5")),
+        "SHM_RINGS": str(args.workers),
+        "SHM_LOCK_DIR": os.path.join(workdir, "locks"),
+    }
+
+    report = {"workers": args.workers, "requests_per_level": args.requests, "modes": {}}
+    for mode in ("local", "shared"):
+        port = _free_port("127.0.0.1")
+        base_url = f"http://127.0.0.1:{port}"
+        print(f"🏁 {mode}: starting {args.workers} workers on :{port}")
+        procs = start_mode(mode, args.workers, port, env)
+        try:
+            asyncio.run(wait_ready(base_url, args.workers))
+            idle = tree_memory_mb([p.pid for p in procs])
+            results = asyncio.run(measure(base_url, concurrency_levels, args.requests))
+            loaded = tree_memory_mb([p.pid for p in procs])
+        finally:
+            stop_mode(procs)
+
+        report["modes"][mode] = {"memory_idle": idle, "memory_after_load": loaded, "results": results}
+        print(f"  memory: RSS {loaded['rss_mb']} MB, PSS {loaded['pss_mb']} MB "
+              f"across {loaded['processes']} processes")
+        for r in results:
+            print(f"  c={r['concurrency']:<3d} {r['throughput_rps']:8.1f} req/s  "
+                  f"p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms p99={r['p99_ms']:.1f}ms "
+                  f"errors={r['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Latency of test-time augmentation vs number of views.
+
+    python -m benchmarks.bench_tta --repeats 50 --output tta.json
+
+For each view count, compares one batched forward pass (what /predict?tta=true
+does) with scoring the same views one call at a time.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import build_tiny_model
+from tta import TTA_VIEWS, make_tta_batch
+
+IMG_SIZE = (224, 224)
+
+
+def time_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return round(float(np.median(samples)), 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TTA latency vs views benchmark")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--model", help="Model file to use (default: tiny stand-in model)")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    from model_registry import ModelRegistry
+
+    model_path = args.model or build_tiny_model(
+        os.path.join(tempfile.mkdtemp(prefix="oncodetect-tta-"), "tiny_model.h5")
+    )
+    registry = ModelRegistry(IMG_SIZE)
+    entry = registry.load("bench", model_path)
+
+    rng = np.random.default_rng(0)
+    img_array = rng.integers(0, 256, size=(1, *IMG_SIZE, 3), dtype=np.uint8)
+
+    # Compile every batch shape up front so tracing isn't counted
+    for views in range(1, len(TTA_VIEWS) + 1):
+        entry.predict(make_tta_batch(img_array, views))
+
+    results = []
+    print(f"{'views':>5s} {'augment':>9s} {'batched':>9s} {'sequential':>11s} {'speedup':>8s}")
+    for views in range(1, len(TTA_VIEWS) + 1):
+        augment_ms = time_ms(lambda: make_tta_batch(img_array, views), args.repeats)
+        batch = make_tta_batch(img_array, views)
+        batched_ms = time_ms(lambda: entry.predict(batch), args.repeats)
+        sequential_ms = time_ms(
+            lambda: [entry.predict(batch[i:i + 1]) for i in range(views)], args.repeats
+        )
+        results.append({
+            "views": views,
+            "augment_ms": augment_ms,
+            "batched_ms": batched_ms,
+            "sequential_ms": sequential_ms,
+            "speedup": round(sequential_ms / batched_ms, 2) if batched_ms else None,
+        })
+        print(f"{views:5d} {augment_ms:8.2f}ms {batched_ms:8.2f}ms {sequential_ms:10.2f}ms "
+              f"{results[-1]['speedup']:7.2f}x")
+
+    registry.shutdown()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"repeats": args.repeats, "results": results}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+# ========== Isolation ==========
+
+def isolated_env(workdir):
+    """
+    Settings that point every file the API writes (database, heatmaps,
+    embedding index, Parquet archive, profiles) into `workdir`, so a
+    benchmark never touches the served data.
+    """
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "HEATMAP_DIR": os.path.join(workdir, "heatmaps"),
+        "EMBEDDING_DIR": os.path.join(workdir, "embeddings"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "PROFILE_DIR": os.path.join(workdir, "profiles"),
+    }
+
+# ========== Synthetic Inputs ==========
+
+def make_synthetic_image(size, seed=0):
+    """Build a PNG that looks roughly like a CT nodule crop (noise + bright blob)."""
+    rng = np.random.default_rng(seed)
+    h, w = size
+    y, x = np.ogrid[:h, :w]
+    blob = np.exp(-((x - w / 2) ** 2 + (y - h / 2) ** 2) / (2 * (min(h, w) / 6) ** 2))
+    pixels = 60 + 150 * blob + rng.normal(0, 12, size=(h, w))
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode="L").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+# ========== Stand-in Model ==========
+
+def build_tiny_model(path, input_shape=(224, 224, 3)):
+    """
+    Save a tiny Keras model with the same input/output contract as the
+    production model (224x224x3 in, one sigmoid score out).
+    """
+    from tensorflow import keras
+
+    if os.path.exists(path):
+        return path
+
+    inputs = keras.Input(shape=input_shape)
+    x = keras.layers.Rescaling(1.0 / 255)(inputs)
+    x = keras.layers.Conv2D(8, 3, strides=4, activation="relu")(x)
+    x = keras.layers.GlobalAveragePooling2D()(x)
+    x = keras.layers.Dense(16, activation="relu")(x)
+    outputs = keras.layers.Dense(1, activation="sigmoid")(x)
+    model = keras.Model(inputs, outputs)
+    model.save(path)
+    return path
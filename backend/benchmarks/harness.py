@@ -0,0 +1,123 @@
+import asyncio
+import socket
+import threading
+import time
+
+import httpx
+import numpy as np
+
+# ========== Targets ==========
+
+class InProcessTarget:
+    """Drive the ASGI app directly, without sockets (measures app + model cost only)."""
+
+    name = "inprocess"
+
+    def __init__(self, app):
+        self.app = app
+        self.client = None
+
+    async def __aenter__(self):
+        await self.app.router.startup()
+        transport = httpx.ASGITransport(app=self.app)
+        self.client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+        return self.client
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        await self.app.router.shutdown()
+
+
+class HttpTarget:
+    """Serve the app from a local uvicorn server in a background thread."""
+
+    name = "http"
+
+    def __init__(self, app, host="127.0.0.1", port=None):
+        self.app = app
+        self.host = host
+        self.port = port or _free_port(host)
+        self.server = None
+        self.thread = None
+        self.client = None
+
+    async def __aenter__(self):
+        import uvicorn
+
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("uvicorn exited before startup completed")
+            await asyncio.sleep(0.05)
+
+        self.client = httpx.AsyncClient(
+            base_url=f"http://{self.host}:{self.port}",
+            timeout=60,
+            limits=httpx.Limits(max_connections=256, max_keepalive_connections=256),
+        )
+        return self.client
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def _free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+# ========== Load Generation ==========
+
+async def run_load(client, method, path, concurrency, total_requests, request_kwargs=None, warmup=5):
+    """
+    Fire `total_requests` requests with `concurrency` in flight and return
+    throughput and latency percentiles.
+    """
+    request_kwargs = request_kwargs or (lambda i: {})
+
+    for i in range(warmup):
+        await client.request(method, path, **request_kwargs(i))
+
+    latencies = []
+    errors = 0
+    pending = iter(range(total_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **request_kwargs(i))
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return summarize(latencies, errors, elapsed)
+
+
+def summarize(latencies, errors, elapsed):
+    """Reduce raw latencies (seconds) to the numbers we track between runs."""
+    samples = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if samples.size else (0.0, 0.0, 0.0)
+    return {
+        "requests": int(samples.size),
+        "errors": int(errors),
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(samples.size / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(float(samples.mean()), 3) if samples.size else 0.0,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+    }
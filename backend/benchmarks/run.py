@@ -0,0 +1,157 @@
+"""
+API benchmark runner.
+
+    python -m benchmarks.run --mode both --concurrency 1,4,16 --output bench.json
+    python -m benchmarks.run --baseline bench.json --tolerance 0.15
+
+Runs against a throwaway SQLite database and heatmap directory, and uses a
+tiny stand-in model unless --model points at a real one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+
+from benchmarks.fixtures import build_tiny_model, isolated_env, make_synthetic_image
+
+IMAGE_SIZES = [(64, 64), (224, 224)]
+
+
+def build_scenarios():
+    """(name, method, path, request_kwargs) for every endpoint we track."""
+    scenarios = []
+    for size in IMAGE_SIZES:
+        payload = make_synthetic_image(size)
+        name = f"predict_{size[0]}x{size[1]}"
+        scenarios.append((
+            name,
+            "POST",
+            "/predict",
+            lambda i, payload=payload, name=name: {
+                "files": {"file": (f"{name}_{i}.png", payload, "image/png")}
+            },
+        ))
+    scenarios.append(("stats", "GET", "/stats", None))
+    scenarios.append(("predictions", "GET", "/predictions?limit=10", None))
+    return scenarios
+
+
+async def run_target(target, scenarios, concurrency_levels, total_requests):
+    from benchmarks.harness import run_load
+
+    results = []
+    async with target as client:
+        for name, method, path, request_kwargs in scenarios:
+            for concurrency in concurrency_levels:
+                summary = await run_load(
+                    client, method, path, concurrency, total_requests, request_kwargs
+                )
+                results.append({
+                    "target": target.name,
+                    "scenario": name,
+                    "concurrency": concurrency,
+                    **summary,
+                })
+                print(
+                    f"  {target.name:9s} {name:16s} c={concurrency:<3d} "
+                    f"{summary['throughput_rps']:8.1f} req/s  "
+                    f"p50={summary['p50_ms']:.1f}ms p95={summary['p95_ms']:.1f}ms "
+                    f"p99={summary['p99_ms']:.1f}ms errors={summary['errors']}"
+                )
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of human-readable regressions against a stored run."""
+    key = lambda r: (r["target"], r["scenario"], r["concurrency"])
+    previous = {key(r): r for r in baseline.get("results", [])}
+
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        label = "{} {} c={}".format(*key(result))
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{label}: throughput {before['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s"
+            )
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{label}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OncoDetect API")
+    parser.add_argument("--mode", choices=["inprocess", "http", "both"], default="both")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels to sweep")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Requests per scenario and concurrency level")
+    parser.add_argument("--model", help="Model file to serve (default: tiny stand-in model)")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed relative regression before failing (default 0.10)")
+    args = parser.parse_args(argv)
+
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    # Isolate DB, data directories and model before main.py reads its configuration
+    workdir = tempfile.mkdtemp(prefix="oncodetect-bench-")
+    os.environ.update(isolated_env(workdir))
+    os.environ["MODEL_PATH"] = args.model or build_tiny_model(os.path.join(workdir, "tiny_model.h5"))
+
+    from main import app
+    from benchmarks.harness import HttpTarget, InProcessTarget
+
+    targets = []
+    if args.mode in ("inprocess", "both"):
+        targets.append(InProcessTarget(app))
+    if args.mode in ("http", "both"):
+        targets.append(HttpTarget(app))
+
+    print(f"🏁 Benchmarking ({args.requests} requests/level, workdir {workdir})")
+    scenarios = build_scenarios()
+    results = []
+    for target in targets:
+        results.extend(asyncio.run(run_target(target, scenarios, concurrency_levels, args.requests)))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "model": "stand-in" if not args.model else os.path.basename(args.model),
+            "requests_per_level": args.requests,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"✅ No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Float, Date, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -23,16 +23,70 @@ class PredictionLog(Base):
     confidence_score = Column(Float, nullable=False)
     raw_score = Column(Float, nullable=False)
     heatmap_filename = Column(String, nullable=True)
+    model_version = Column(String, nullable=True, index=True)
     
     def __repr__(self):
         return f"<Prediction(id={self.id}, result={self.prediction_result}, confidence={self.confidence_score})>"
 
+# ========== Shadow Score Model ==========
+class ShadowPredictionLog(Base):
+    __tablename__ = "shadow_predictions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    prediction_id = Column(Integer, ForeignKey("predictions.id"), nullable=False, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    model_version = Column(String, nullable=False, index=True)
+    raw_score = Column(Float, nullable=False)
+    latency_ms = Column(Float, nullable=False)
+    
+    def __repr__(self):
+        return f"<ShadowPrediction(prediction_id={self.prediction_id}, model={self.model_version}, score={self.raw_score})>"
+
+# ========== Archived Prediction Roll-ups ==========
+class PredictionRollup(Base):
+    """Daily aggregates of predictions that retention moved out to Parquet."""
+    __tablename__ = "prediction_rollups"
+    __table_args__ = (UniqueConstraint("day", "model_version", "prediction_result"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    model_version = Column(String, nullable=False)  # "unknown" for rows logged before versioning
+    prediction_result = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    raw_score_sum = Column(Float, nullable=False, default=0.0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+    raw_score_min = Column(Float, nullable=True)
+    raw_score_max = Column(Float, nullable=True)
+    
+    def __repr__(self):
+        return f"<PredictionRollup(day={self.day}, model={self.model_version}, result={self.prediction_result}, count={self.count})>"
+
 # ========== Initialize Database ==========
 def init_db():
     """Create all tables."""
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
     print("✅ Database tables created")
 
+def add_missing_columns():
+    """
+    Add nullable columns introduced after a table was first created.
+    create_all() only creates missing tables, so existing databases would
+    otherwise never pick up new columns.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+                print(f"✅ Added column {table.name}.{column.name}")
+
 def get_db():
     """Dependency for getting database session."""
     db = SessionLocal()
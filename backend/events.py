@@ -0,0 +1,192 @@
+"""
+Live updates for the dashboard over server-sent events (GET /events).
+
+The hub keeps the dashboard's state in memory: aggregate counters (same
+shape as /stats) and the most recent predictions. A new subscriber gets
+that state as a `snapshot` event. After that, every committed prediction
+is pushed to all subscribers as a `prediction` event with the updated
+counters. The database is only read to seed the state when a worker
+goes from no subscribers to one, and every EVENTS_RESYNC_S while it has
+any, never per prediction or per client.
+
+The hub is per process: with several uvicorn workers a stream sees the
+predictions its own worker served as they happen, and the periodic
+resync (pushed as a fresh `snapshot`) folds in everything the other
+workers logged.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+
+# ========== Settings ==========
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "10"))
+# Events buffered per subscriber before a slow client is dropped (it reconnects and resyncs)
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "500"))
+EVENTS_KEEPALIVE_S = float(os.getenv("EVENTS_KEEPALIVE_S", "15"))
+# Streams are closed after this long so they never hold up a graceful shutdown;
+# EventSource reconnects on its own
+EVENTS_MAX_AGE_S = float(os.getenv("EVENTS_MAX_AGE_S", "300"))
+# How often a worker with subscribers re-reads the counters (0 disables);
+# this is what keeps multi-worker deployments from drifting apart
+EVENTS_RESYNC_S = float(os.getenv("EVENTS_RESYNC_S", "30"))
+EVENTS_RETRY_MS = 2000
+
+
+def format_event(event, data):
+    """One SSE message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, size):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.dropped = False
+
+
+class EventHub:
+    """In-process fan-out of prediction events to SSE subscribers."""
+
+    def __init__(self, history=EVENTS_HISTORY, queue_size=EVENTS_QUEUE_SIZE,
+                 max_subscribers=EVENTS_MAX_SUBSCRIBERS):
+        self.history = history
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.stats = None
+        self.recent = deque(maxlen=history)
+        # Highest prediction id already counted in the seeded state
+        self.seeded_through = 0
+        # Predictions published while the database is being read, or None
+        self.pending = None
+        self.seed_lock = asyncio.Lock()
+        self.published = 0
+        self.dropped = 0
+        self.resyncs = 0
+
+    @property
+    def seeded(self):
+        return self.stats is not None
+
+    def seed(self, stats, recent, last_id):
+        """
+        Replace the in-memory state with database values covering
+        predictions up to `last_id`, then fold in anything published since.
+        """
+        pending, self.pending = self.pending or [], None
+        self.stats = dict(stats)
+        self.recent = deque(recent[:self.history], maxlen=self.history)
+        self.seeded_through = last_id
+        for prediction in sorted(pending, key=lambda p: p["id"]):
+            if prediction["id"] > last_id:
+                self._fold(prediction)
+
+    async def ensure_seeded(self, load):
+        """Seed from `await load()` unless another subscriber already did."""
+        async with self.seed_lock:
+            if not self.seeded:
+                await self._reload(load)
+
+    async def resync(self, load):
+        """Re-read the state and push it to current subscribers as a snapshot."""
+        async with self.seed_lock:
+            if not self.subscribers:
+                return
+            await self._reload(load)
+            if not self.subscribers:
+                # Everyone left while the database was read
+                self.stats = None
+                return
+            self.resyncs += 1
+            self.publish("snapshot", self.snapshot())
+
+    async def _reload(self, load):
+        # Buffer predictions published during the read; seed() keeps only
+        # the ones the read didn't cover, so none are lost or counted twice
+        self.pending = []
+        try:
+            self.seed(*await load())
+        finally:
+            self.pending = None
+
+    def snapshot(self):
+        return {"stats": self.stats, "predictions": list(self.recent)}
+
+    def subscribe(self):
+        """Register a subscriber; returns None when the hub is full."""
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscription = Subscription(self.queue_size)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+        if not self.subscribers:
+            # Nobody is watching: stop tracking and resync on the next subscribe
+            self.stats = None
+
+    def publish(self, event, data):
+        """Queue one event for every subscriber (event loop thread only)."""
+        message = format_event(event, data)
+        for subscription in list(self.subscribers):
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscription.dropped = True
+                self.subscribers.discard(subscription)
+                self.dropped += 1
+        self.published += 1
+
+    def publish_prediction(self, prediction):
+        """Fold a committed prediction into the counters and push it; no-op without subscribers."""
+        if self.pending is not None:
+            self.pending.append(prediction)
+        if not self.seeded or prediction["id"] <= self.seeded_through:
+            return
+        self._fold(prediction)
+        self.publish("prediction", {"prediction": prediction, "stats": self.stats})
+
+    def _fold(self, prediction):
+        stats = self.stats
+        label = prediction["prediction"]
+        stats["total_predictions"] += 1
+        stats["live_predictions"] += 1
+        if label == "Benign":
+            stats["benign_count"] += 1
+        elif label == "Malignant":
+            stats["malignant_count"] += 1
+        total = stats["total_predictions"]
+        stats["benign_percentage"] = round(stats["benign_count"] / total * 100, 2)
+        stats["malignant_percentage"] = round(stats["malignant_count"] / total * 100, 2)
+        self.recent.appendleft(prediction)
+
+    async def stream(self, subscription, keepalive=EVENTS_KEEPALIVE_S, max_age=EVENTS_MAX_AGE_S):
+        """SSE body for one subscriber: snapshot, then events until dropped or max_age."""
+        loop = asyncio.get_running_loop()
+        closes_at = loop.time() + max_age
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n" + format_event("snapshot", self.snapshot())
+            while not subscription.dropped:
+                remaining = closes_at - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), min(keepalive, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats_summary(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "seeded": self.seeded,
+            "seeded_through": self.seeded_through,
+            "resyncs": self.resyncs,
+            "published": self.published,
+            "dropped_subscribers": self.dropped,
+        }
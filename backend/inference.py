@@ -0,0 +1,82 @@
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+# Batch sizes traced and executed once at startup so no request pays for it
+# (10 = a full test-time augmentation batch, see tta.py)
+WARMUP_BATCH_SIZES = [
+    int(b) for b in os.getenv("WARMUP_BATCH_SIZES", "1,8,10").split(",") if b.strip()
+]
+
+# ========== Compiled Predict Path ==========
+
+def build_predict_fn(model, img_size):
+    """
+    Wrap a Keras model in a tf.function with a fixed input signature.
+
+    Replaces `model.predict`, which rebuilds its data pipeline on every call
+    and traces lazily on first use. The batch dimension is left open so a
+    single concrete function serves every batch size.
+
+    The function returns an (N, 1 + D) array: column 0 is the malignancy
+    score and the remaining D columns are the penultimate-layer embedding
+    from the same forward pass. Returns (predict_fn, D).
+    """
+    height, width = img_size
+    scoring_model, embedding_dim = _with_embedding(model)
+
+    @tf.function(
+        input_signature=[tf.TensorSpec(shape=[None, height, width, 3], dtype=tf.uint8)],
+        reduce_retracing=True,
+    )
+    def predict_fn(images):
+        outputs = scoring_model(tf.cast(images, tf.float32), training=False)
+        if not embedding_dim:
+            return outputs
+        score, embedding = outputs
+        batch = tf.shape(images)[0]
+        return tf.concat([tf.reshape(score, [batch, -1])[:, :1],
+                          tf.reshape(embedding, [batch, -1])], axis=1)
+
+    return predict_fn, embedding_dim
+
+
+def _with_embedding(model):
+    """Expose the penultimate layer as a second output, if the model allows it."""
+    try:
+        penultimate = model.layers[-2]
+        extractor = keras.Model(inputs=model.inputs, outputs=[model.outputs[0], penultimate.output])
+        return extractor, int(np.prod(penultimate.output.shape[1:]))
+    except Exception as e:
+        print(f"⚠️ No embedding output for this model ({str(e)}); similar-case search disabled")
+        return model, 0
+
+
+def split_outputs(outputs):
+    """Split predict_fn output into (scores (N,), embeddings (N, D))."""
+    return outputs[:, 0], outputs[:, 1:]
+
+
+def run_predict(predict_fn, img_array):
+    """Run the compiled predict path on a uint8 NHWC batch and return a NumPy array."""
+    return predict_fn(tf.convert_to_tensor(img_array, dtype=tf.uint8)).numpy()
+
+# ========== Warm-up ==========
+
+def warm_up(predict_fn, img_size, batch_sizes=None):
+    """
+    Trace the graph and run one dummy batch per configured batch size.
+
+    Returns {batch_size: seconds} so the startup log shows what the first
+    real request would otherwise have paid.
+    """
+    timings = {}
+    for batch_size in batch_sizes or WARMUP_BATCH_SIZES:
+        dummy = np.zeros((batch_size, *img_size, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        run_predict(predict_fn, dummy)
+        timings[batch_size] = time.perf_counter() - start
+    return timings
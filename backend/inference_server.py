@@ -0,0 +1,135 @@
+"""
+Single-process model server for SERVING_MODE=shared.
+
+Owns the only TensorFlow runtime and model copy on the node. uvicorn
+workers hand it preprocessed tensors through shared-memory rings (see
+shm_ring.py) and it scores everything that is waiting in one batch.
+
+    python inference_server.py --rings 4 &
+    SERVING_MODE=shared SHM_RINGS=4 uvicorn main:app --workers 4
+"""
+import argparse
+import os
+import signal
+import time
+
+import numpy as np
+
+from model_registry import ModelRegistry
+from shm_ring import HEARTBEAT_INTERVAL_S, RING_NAME, READY, DONE, ERROR, ShmRing
+
+MODEL_PATH = os.getenv("MODEL_PATH", "oncodetect_model_v3.h5")
+MODEL_VERSION = os.getenv("MODEL_VERSION", "v3")
+IMG_SIZE = (224, 224)
+
+
+def collect_ready(rings, max_batch):
+    """Pick READY slots across all rings, up to `max_batch` images in total."""
+    picked = []
+    total = 0
+    for ring in rings:
+        for slot in np.flatnonzero(ring.states == READY):
+            count = int(ring.counts[slot])
+            if picked and total + count > max_batch:
+                return picked
+            picked.append((ring, int(slot), count))
+            total += count
+    return picked
+
+
+def score_batch(entry, picked):
+    """Run one forward pass over every picked slot and write results back."""
+    if len(picked) == 1:
+        ring, slot, count = picked[0]
+        inputs = ring.inputs[slot][:count]  # zero-copy view into shared memory
+    else:
+        inputs = np.concatenate([ring.inputs[slot][:count] for ring, slot, count in picked])
+
+    try:
+        scores = entry.predict(inputs).reshape(len(inputs), -1)
+    except Exception as e:
+        print(f"❌ Inference error: {str(e)}")
+        for ring, slot, _ in picked:
+            ring.states[slot] = ERROR
+        return
+
+    offset = 0
+    for ring, slot, count in picked:
+        width = min(scores.shape[1], ring.output_width)
+        ring.outputs[slot][:count, :width] = scores[offset:offset + count, :width]
+        offset += count
+        ring.states[slot] = DONE
+
+
+def serve(rings_count, slots, max_batch, idle_sleep):
+    registry = ModelRegistry(IMG_SIZE)
+    entry = registry.load(MODEL_VERSION, MODEL_PATH)
+    registry.activate(MODEL_VERSION)
+    for batch_size, seconds in entry.warmup_timings.items():
+        print(f"🔥 Warm-up {MODEL_VERSION} batch={batch_size}: {seconds*1000:.0f}ms")
+
+    # A new generation per run lets workers tell a restarted server from the old one
+    generation = time.time_ns()
+    rings = [
+        ShmRing.create(RING_NAME.format(i), slots, max_batch, IMG_SIZE, entry.output_width, generation)
+        for i in range(rings_count)
+    ]
+    for ring in rings:
+        ring.set_model_version(MODEL_VERSION)
+        ring.set_ready(True)
+
+    running = True
+
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"✅ Inference server ready: {rings_count} rings x {slots} slots, max batch {max_batch}")
+    batches = 0
+    images = 0
+    sleep = idle_sleep
+    next_beat = 0.0
+    try:
+        while running:
+            now = time.monotonic()
+            if now >= next_beat:
+                # Workers treat a ring whose heartbeat stops as a dead server
+                for ring in rings:
+                    ring.beat()
+                next_beat = now + HEARTBEAT_INTERVAL_S
+            picked = collect_ready(rings, max_batch)
+            if not picked:
+                # Back off while idle, spin again as soon as work shows up
+                time.sleep(sleep)
+                sleep = min(sleep * 2, idle_sleep * 16)
+                continue
+            sleep = idle_sleep
+            score_batch(entry, picked)
+            batches += 1
+            images += sum(count for _, _, count in picked)
+    finally:
+        for ring in rings:
+            ring.set_ready(False)
+            ring.close()
+        print(f"👋 Inference server stopped after {batches} batches ({images} images)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OncoDetect shared-memory inference server")
+    parser.add_argument("--rings", type=int, default=int(os.getenv("SHM_RINGS", "4")),
+                        help="Number of rings (one per uvicorn worker)")
+    parser.add_argument("--slots", type=int, default=int(os.getenv("SHM_SLOTS", "8")),
+                        help="In-flight requests per worker")
+    parser.add_argument("--max-batch", type=int, default=int(os.getenv("SHM_MAX_BATCH", "16")),
+                        help="Largest batch scored in one forward pass")
+    parser.add_argument("--idle-sleep", type=float, default=0.0002,
+                        help="Initial poll interval in seconds while idle")
+    args = parser.parse_args(argv)
+    serve(args.rings, args.slots, args.max_batch, args.idle_sleep)
+
+
+if __name__ == "__main__":
+    main()
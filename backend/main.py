@@ -1,19 +1,31 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, Query
+from typing import List
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-import tensorflow as tf
-from tensorflow import keras
 import numpy as np
-import cv2
-from PIL import Image
-import io
+import asyncio
+import hmac
 import os
+import threading
 from datetime import datetime
 import uuid
 
 # Import database components
-from database import init_db, get_db, PredictionLog
+from sqlalchemy import func
+from database import init_db, get_db, SessionLocal, PredictionLog, PredictionRollup, ShadowPredictionLog
+from events import EVENTS_RESYNC_S, EventHub
+from model_registry import ModelRegistry
+from readiness import Readiness, FAILED
+from profiling import NO_TRACE, Profiler, profile_requested
+from scheduler import ANONYMOUS, BATCH, FRONTEND, INTERACTIVE, SCHEDULER_MAX_BATCH, InferenceScheduler, SchedulerRejected
+import retention
+from shm_ring import InferenceServerUnavailable, SharedMemoryClient
+from tta import TTA_VIEWS, make_tta_batch, summarize_scores
+from vector_index import VectorIndex, index_directory
+from uploads import MAX_UPLOAD_BYTES, MAX_SCREEN_UPLOAD_BYTES, UploadLimitMiddleware, inspect_upload, inspect_dicom_upload, open_image
+import screening
 
 # ========== Initialize FastAPI App ==========
 app = FastAPI(
@@ -22,56 +34,350 @@ app = FastAPI(
     version="1.0.1"
 )
 
+# Browser origins allowed by CORS
+FRONTEND_ORIGINS = [
+    "http://localhost:3000",
+    "https://oncodetect-frontend.onrender.com",
+    "https://*.onrender.com"
+]
+
+# Cut off oversized uploads while they stream in
+# (added before CORS so CORS wraps it and its 413s carry the CORS headers)
+app.add_middleware(UploadLimitMiddleware, limits={"/predict": MAX_UPLOAD_BYTES, "/screen": MAX_SCREEN_UPLOAD_BYTES})
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "https://oncodetect-frontend.onrender.com",
-        "https://*.onrender.com"
-    ],
+    allow_origins=FRONTEND_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 # ========== Global Variables ==========
-MODEL = None
-MODEL_PATH = "oncodetect_model_v3.h5"
-HEATMAP_DIR = "heatmaps"
+MODEL_PATH = os.getenv("MODEL_PATH", "oncodetect_model_v3.h5")
+MODEL_VERSION = os.getenv("MODEL_VERSION", "v3")
+MODEL_DIR = os.getenv("MODEL_DIR", ".")
+# Extra versions to preload, e.g. "v4=oncodetect_model_v4.h5,v5=oncodetect_model_v5.h5"
+EXTRA_MODELS = os.getenv("EXTRA_MODELS", "")
+SHADOW_MODEL = os.getenv("SHADOW_MODEL")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+# Shadow scores waiting for the shadow model before new samples are dropped
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "16"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# API keys whose requests are scheduled as interactive (comma-separated); other keys are batch
+INTERACTIVE_API_KEYS = set(filter(None, (k.strip() for k in os.getenv("INTERACTIVE_API_KEYS", "").split(","))))
+# Dashboard origins whose unkeyed uploads are scheduled as interactive (comma-separated).
+# Origin is only a hint any client can send, so localhost is left out; add it for local dev
+INTERACTIVE_ORIGINS = set(filter(None, (o.strip() for o in os.getenv(
+    "INTERACTIVE_ORIGINS", "https://oncodetect-frontend.onrender.com").split(","))))
+HEATMAP_DIR = os.getenv("HEATMAP_DIR", "heatmaps")
+# Embedding indexes live next to the database, one subdirectory per model version
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "embeddings")
 IMG_SIZE = (224, 224)
 
+# "local": every worker loads its own model; "shared": workers send tensors
+# to inference_server.py through shared memory and load no model at all
+SERVING_MODE = os.getenv("SERVING_MODE", "local")
+SHM_RINGS = int(os.getenv("SHM_RINGS", "4"))
+SHM_LOCK_DIR = os.getenv("SHM_LOCK_DIR", "/tmp/oncodetect-shm")
+
+# "background": answer / and /health immediately and load the model in a
+# background task; "blocking": finish loading before accepting traffic
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+# How long /predict waits for a still-loading model before returning 503
+READY_TIMEOUT_S = float(os.getenv("READY_TIMEOUT_S", "30"))
+
+REGISTRY = ModelRegistry(IMG_SIZE, shadow_max_pending=SHADOW_MAX_PENDING)
+READINESS = Readiness()
+PROFILER = Profiler()
+# Every scoring call is queued here; see scheduler.py
+SCHEDULER = InferenceScheduler(lambda images: score_batch(images, offload=True))
+# Live dashboard updates for GET /events
+EVENTS = EventHub()
+SHM_CLIENT = None
+EMBEDDING_INDEXES = {}
+# Indexes are opened from threadpool threads
+EMBEDDING_INDEXES_LOCK = threading.Lock()
+BACKGROUND_TASKS = set()
+
 os.makedirs(HEATMAP_DIR, exist_ok=True)
 
 # ========== Startup: Load Model & Initialize DB ==========
 @app.on_event("startup")
 async def startup_event():
-    global MODEL
     print("🚀 Starting OncoDetect API...")
+    READINESS.reset()
     
     # Initialize database
     init_db()
+    print("✅ Database initialized!")
+    
+    start_background_task(SCHEDULER.run())
+    if retention.RETENTION_INTERVAL_S > 0 and retention.RETENTION_DAYS > 0:
+        start_background_task(retention_loop())
+    if EVENTS_RESYNC_S > 0:
+        start_background_task(events_resync_loop())
     
-    # Load model
+    if STARTUP_MODE == "blocking":
+        await load_models()
+        return
+    
+    # Serve health checks right away; TensorFlow and the model load behind them
+    start_background_task(load_models())
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+
+async def retention_loop():
+    """Periodically move old prediction logs to the Parquet archive."""
+    while True:
+        await asyncio.sleep(retention.RETENTION_INTERVAL_S)
+        try:
+            summary = await run_in_threadpool(retention.run_retention)
+        except Exception as e:
+            print(f"❌ Retention job failed: {str(e)}")
+            continue
+        if summary and summary["rows"]:
+            print(f"🗄️ Archived {summary['rows']} predictions from {len(summary['days'])} days")
+
+async def events_resync_loop():
+    """Refresh the event hub from the database so every worker's streams converge."""
+    while True:
+        await asyncio.sleep(EVENTS_RESYNC_S)
+        try:
+            await EVENTS.resync(read_dashboard_state)
+        except Exception as e:
+            print(f"❌ Event stream resync failed: {str(e)}")
+
+async def load_models():
+    """Load (or connect to) the model and drive the readiness state machine."""
+    global SHM_CLIENT
+    try:
+        if SERVING_MODE == "shared":
+            print("Connecting to inference server...")
+            SHM_CLIENT = await SharedMemoryClient(SHM_RINGS, SHM_LOCK_DIR, on_attach=fit_scheduler_to_ring).connect()
+            print(f"✅ Using shared-memory ring {SHM_CLIENT.index} (model {SHM_CLIENT.model_version})")
+        else:
+            await run_in_threadpool(load_local_models)
+    except Exception as e:
+        READINESS.mark_failed(e)
+        print(f"❌ Model loading failed: {str(e)}")
+        return
+    READINESS.mark_ready()
+    print(f"✅ Ready after {READINESS.ready_after_s:.1f}s")
+
+def fit_scheduler_to_ring(ring):
+    """Keep forward passes within one ring slot; re-run on every (re)attach since --max-batch can change."""
+    SCHEDULER.max_batch = min(SCHEDULER_MAX_BATCH, ring.max_batch)
+
+def load_local_models():
+    # Load models (each one is compiled and warmed up before it can serve)
     print("Loading model...")
-    MODEL = keras.models.load_model(MODEL_PATH)
-    print("✅ Model loaded successfully!")
-    print("✅ Database initialized!")
+    load_model_version(MODEL_VERSION, MODEL_PATH)
+    for spec in filter(None, EXTRA_MODELS.split(",")):
+        version, path = spec.split("=", 1)
+        load_model_version(version.strip(), os.path.join(MODEL_DIR, path.strip()))
+    
+    REGISTRY.activate(MODEL_VERSION)
+    if SHADOW_MODEL:
+        REGISTRY.set_shadow(SHADOW_MODEL, SHADOW_SAMPLE_RATE)
+        print(f"👥 Shadow scoring {SHADOW_SAMPLE_RATE:.0%} of traffic with {SHADOW_MODEL}")
+    print(f"✅ Model {MODEL_VERSION} active!")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in list(BACKGROUND_TASKS):
+        task.cancel()
+    REGISTRY.shutdown()
+    if SHM_CLIENT is not None:
+        SHM_CLIENT.close()
+
+def load_model_version(version, path):
+    """Load a model version into the registry and log its warm-up timings."""
+    entry = REGISTRY.load(version, path)
+    for batch_size, seconds in entry.warmup_timings.items():
+        print(f"🔥 Warm-up {version} batch={batch_size}: {seconds*1000:.0f}ms")
+    print(f"✅ Model {version} loaded from {path}")
+    return entry
 
 # ========== Helper Functions ==========
 
-def preprocess_image(image_bytes):
-    """Preprocess uploaded image."""
-    image = Image.open(io.BytesIO(image_bytes))
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    image = image.resize(IMG_SIZE)
-    img_array = np.array(image).astype('uint8')
-    img_array = np.expand_dims(img_array, axis=0)
+def model_ready():
+    """True once a model can serve requests in the current serving mode."""
+    if not READINESS.is_ready:
+        return False
+    if SHM_CLIENT is not None:
+        return SHM_CLIENT.ready
+    return REGISTRY.active() is not None
+
+async def wait_for_model():
+    """Hold a request until the model is ready, or fail with 503."""
+    if await READINESS.wait(READY_TIMEOUT_S) and model_ready():
+        return
+    if READINESS.state == FAILED:
+        raise HTTPException(status_code=503, detail=f"Model failed to load: {READINESS.error}")
+    raise HTTPException(
+        status_code=503,
+        # Past startup in shared mode, only the inference server can be missing
+        detail="Inference server is not running" if READINESS.is_ready else "Model is still loading",
+        headers={"Retry-After": "5"}
+    )
+
+def active_model_version():
+    if SHM_CLIENT is not None:
+        return SHM_CLIENT.model_version
+    entry = REGISTRY.active()
+    return entry.version if entry else None
+
+async def score_batch(img_array, offload=False):
+    """
+    Score a uint8 NHWC batch with the local registry or, in shared mode,
+    the inference server. Returns (outputs, model_version), where outputs
+    is (N, 1 + D): the score in column 0 followed by the embedding.
+    With offload=True a local model runs on the threadpool so large
+    batches don't stall the event loop.
+    """
+    if SHM_CLIENT is not None:
+        try:
+            scores = await SHM_CLIENT.predict(img_array)
+        except InferenceServerUnavailable as e:
+            # The client re-attaches as soon as the server is back
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        return scores, SHM_CLIENT.model_version
+    
+    # Pin the model for the whole call so a hot-swap can't split it
+    entry = REGISTRY.active()
+    if entry is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if offload:
+        return await run_in_threadpool(entry.predict, img_array), entry.version
+    return entry.predict(img_array), entry.version
+
+def request_priority(x_priority, x_api_key, origin):
+    """
+    (priority class, fair-queue key) for a request. Keys listed in
+    INTERACTIVE_API_KEYS are interactive under their own key; that is the
+    only guaranteed route. Unkeyed uploads whose Origin is in
+    INTERACTIVE_ORIGINS share the "frontend" key as interactive, but Origin
+    is a best-effort hint: a non-browser client can send any value.
+    Everything else is batch, unkeyed traffic under "anonymous".
+    X-Priority can only lower a request to batch.
+    """
+    if x_api_key:
+        priority, key = (INTERACTIVE if x_api_key in INTERACTIVE_API_KEYS else BATCH), x_api_key
+    elif origin in INTERACTIVE_ORIGINS:
+        priority, key = INTERACTIVE, FRONTEND
+    else:
+        priority, key = BATCH, ANONYMOUS
+    if (x_priority or "").strip().lower() == BATCH:
+        priority = BATCH
+    return priority, key
+
+async def schedule(images, priority, api_key=None, deadline_ms=None):
+    """Score through the scheduler; shed requests become 503 with Retry-After."""
+    try:
+        return await SCHEDULER.submit(images, priority, api_key, deadline_ms)
+    except SchedulerRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Inference overloaded ({priority}): {e.reason}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def is_admin(x_admin_token):
+    """True only for the configured ADMIN_TOKEN; with none configured nobody is admin."""
+    if not ADMIN_TOKEN or x_admin_token is None:
+        return False
+    return hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode())
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Guard admin endpoints; they stay closed until ADMIN_TOKEN is configured."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled: set ADMIN_TOKEN")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def log_shadow_score(prediction_id):
+    """Build the callback that stores a shadow model's score for a prediction."""
+    def on_result(version, raw_score, latency_seconds):
+        db = SessionLocal()
+        try:
+            db.add(ShadowPredictionLog(
+                prediction_id=prediction_id,
+                model_version=version,
+                raw_score=raw_score,
+                latency_ms=latency_seconds * 1000
+            ))
+            db.commit()
+        except Exception as e:
+            print(f"❌ Shadow log error: {str(e)}")
+        finally:
+            db.close()
+    return on_result
+
+def commit_log(db, row):
+    """Insert a log row and load its generated id and timestamp."""
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+
+def prediction_summary(p):
+    """A PredictionLog row as listed by /predictions and pushed on /events."""
+    return {
+        "id": p.id,
+        "timestamp": p.timestamp.isoformat(),
+        "filename": p.input_filename,
+        "prediction": p.prediction_result,
+        "confidence": round(p.confidence_score * 100, 2),
+        "model_version": p.model_version
+    }
+
+def load_dashboard_state():
+    """Stats, recent predictions and the last prediction id they cover, to seed the event hub."""
+    db = SessionLocal()
+    try:
+        # Everything is read up to one id so rows committed meanwhile are left to the hub
+        last_id = db.query(func.max(PredictionLog.id)).scalar() or 0
+        recent = db.query(PredictionLog).filter(PredictionLog.id <= last_id).order_by(
+            PredictionLog.timestamp.desc()
+        ).limit(EVENTS.history).all()
+        return compute_stats(db, last_id), [prediction_summary(p) for p in recent], last_id
+    finally:
+        db.close()
+
+async def read_dashboard_state():
+    return await run_in_threadpool(load_dashboard_state)
+
+def get_embedding_index(model_version):
+    """Open (once per process) the embedding index for a model version."""
+    with EMBEDDING_INDEXES_LOCK:
+        if model_version not in EMBEDDING_INDEXES:
+            EMBEDDING_INDEXES[model_version] = VectorIndex(index_directory(model_version, EMBEDDING_DIR))
+        return EMBEDDING_INDEXES[model_version]
+
+def preprocess_image(fileobj, image_format, trace=NO_TRACE):
+    """Preprocess uploaded image, decoding straight from the spooled upload."""
+    try:
+        with trace.stage("decode"):
+            image = open_image(fileobj, image_format)
+            image.load()
+        with trace.stage("preprocess"):
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image = image.resize(IMG_SIZE)
+            img_array = np.array(image).astype('uint8')
+            img_array = np.expand_dims(img_array, axis=0)
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
     return img_array, image
 
 def generate_simple_heatmap(image, prediction_score):
     """Generate visualization heatmap."""
+    import cv2  # deferred: OpenCV adds noticeably to cold-start import time
+    
     img_array = np.array(image)
     h, w = img_array.shape[:2]
     y, x = np.ogrid[:h, :w]
@@ -85,6 +391,11 @@ def generate_simple_heatmap(image, prediction_score):
     superimposed = cv2.addWeighted(img_bgr, 0.6, heatmap, 0.4, 0)
     return superimposed
 
+def save_heatmap(path, heatmap_image):
+    import cv2
+    
+    cv2.imwrite(path, heatmap_image)
+
 # ========== API Endpoints ==========
 
 @app.get("/")
@@ -93,62 +404,137 @@ async def root():
     return {
         "status": "healthy",
         "service": "OncoDetect API",
-        "model_loaded": MODEL is not None,
+        "model_loaded": model_ready(),
+        "model_state": READINESS.state,
         "version": "1.0.1",
         "database": "connected"
     }
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+def health_check(db: Session = Depends(get_db)):
     """Detailed health check with database stats."""
     prediction_count = db.query(PredictionLog).count()
     return {
         "status": "healthy",
-        "model_loaded": MODEL is not None,
-        "model_path": MODEL_PATH,
+        "model_loaded": model_ready(),
+        "model_path": REGISTRY.active().path if REGISTRY.active() else MODEL_PATH,
+        "model_version": active_model_version(),
+        "serving_mode": SERVING_MODE,
+        "startup": READINESS.snapshot(),
+        "event_stream": EVENTS.stats_summary(),
         "total_predictions": prediction_count,
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    if READINESS.state == FAILED:
+        # A restart is the only way out of a failed model load
+        return JSONResponse(status_code=503, content={"status": "failed", "error": READINESS.error})
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: model loaded and warmed up."""
+    if not model_ready():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "model_loaded": False, **READINESS.snapshot()}
+        )
+    return {"status": "ready", "model_loaded": True, **READINESS.snapshot()}
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def predict(
+    file: UploadFile = File(...),
+    tta: bool = False,
+    tta_views: int = Query(None, ge=1, le=len(TTA_VIEWS)),
+    x_profile: str = Header(None),
+    x_admin_token: str = Header(None),
+    x_priority: str = Header(None),
+    x_api_key: str = Header(None),
+    x_deadline_ms: float = Header(None),
+    origin: str = Header(None),
+    db: Session = Depends(get_db)
+):
     """
     Main prediction endpoint with database logging.
+    With ?tta=true the image is scored as a batch of flipped, rotated and
+    shifted views in one forward pass and the mean score is used.
+    Send X-Profile: 1 to profile the request (see /profiling).
+    X-API-Key, X-Priority: batch and X-Deadline-Ms feed the scheduler
+    (see request_priority and /scheduler).
     """
+    trace, profile_skipped = NO_TRACE, None
+    asked = profile_requested(x_profile)
+    if asked or PROFILER.armed:
+        requested = asked and is_admin(x_admin_token)
+        trace, profile_skipped = PROFILER.start("/predict", requested)
+        if asked and not requested:
+            profile_skipped = "unauthorized"
+    
     try:
-        if MODEL is None:
-            raise HTTPException(status_code=503, detail="Model not loaded")
-        
-        if not file.content_type.startswith('image/'):
+        if not (file.content_type or "").startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read and preprocess image
-        image_bytes = await file.read()
-        img_array, original_image = preprocess_image(image_bytes)
+        # Validate size, magic bytes and dimensions before decoding anything
+        with trace.stage("validate"):
+            image_format, _ = inspect_upload(file)
+        img_array, original_image = preprocess_image(file.file, image_format, trace)
+        
+        # Preprocessing overlaps with a model that is still loading
+        with trace.stage("wait_model"):
+            await wait_for_model()
         
         # Make prediction
-        prediction = MODEL.predict(img_array, verbose=0)[0][0]
+        tta_summary = None
+        priority, queue_key = request_priority(x_priority, x_api_key, origin)
+        with trace.stage("model"):
+            if tta:
+                outputs, model_version = await schedule(
+                    make_tta_batch(img_array, tta_views), priority, queue_key, x_deadline_ms
+                )
+                tta_summary = summarize_scores(outputs[:, 0])
+                prediction = tta_summary["mean_score"]
+            else:
+                outputs, model_version = await schedule(img_array, priority, queue_key, x_deadline_ms)
+                prediction = outputs[0][0]
+        # Embedding of the unaugmented view, from the same forward pass
+        embedding = outputs[0, 1:]
         is_malignant = prediction > 0.5
         confidence = float(prediction if is_malignant else 1 - prediction)
         label = "Malignant" if is_malignant else "Benign"
         
         # Generate heatmap
-        heatmap_image = generate_simple_heatmap(original_image, prediction)
+        with trace.stage("heatmap"):
+            heatmap_image = generate_simple_heatmap(original_image, prediction)
         heatmap_filename = f"{uuid.uuid4()}.jpg"
         heatmap_path = os.path.join(HEATMAP_DIR, heatmap_filename)
-        cv2.imwrite(heatmap_path, heatmap_image)
+        with trace.stage("imwrite"):
+            save_heatmap(heatmap_path, heatmap_image)
         
         # ========== Log to Database ==========
-        db_log = PredictionLog(
-            input_filename=file.filename,
-            prediction_result=label,
-            confidence_score=confidence,
-            raw_score=float(prediction),
-            heatmap_filename=heatmap_filename
-        )
-        db.add(db_log)
-        db.commit()
-        db.refresh(db_log)
+        with trace.stage("db_commit"):
+            db_log = PredictionLog(
+                input_filename=file.filename,
+                prediction_result=label,
+                confidence_score=confidence,
+                raw_score=float(prediction),
+                heatmap_filename=heatmap_filename,
+                model_version=model_version
+            )
+            # Off the event loop: with the pool exhausted a blocking checkout would stall every request
+            await run_in_threadpool(commit_log, db, db_log)
+        
+        if embedding.size:
+            with trace.stage("embedding_index"):
+                # Appends take a file lock shared with other workers, so keep them off the loop
+                await run_in_threadpool(get_embedding_index(model_version).add, db_log.id, embedding)
+        
+        EVENTS.publish_prediction(prediction_summary(db_log))
+        
+        # Candidate model scores a sample of traffic off the request path
+        REGISTRY.maybe_shadow(img_array, log_shadow_score(db_log.id))
         
         # Prepare response
         response = {
@@ -158,16 +544,99 @@ async def predict(file: UploadFile = File(...), db: Session = Depends(get_db)):
             "heatmap_url": f"/heatmap/{heatmap_filename}",
             "timestamp": db_log.timestamp.isoformat(),
             "filename": file.filename,
-            "prediction_id": db_log.id
+            "prediction_id": db_log.id,
+            "model_version": model_version
         }
+        if tta_summary is not None:
+            response["tta"] = tta_summary
         
         print(f"✅ Prediction #{db_log.id}: {label} ({confidence*100:.1f}%) - {file.filename}")
         
-        return JSONResponse(content=response)
+        headers = {}
+        if trace.enabled:
+            PROFILER.finish(trace, prediction_id=db_log.id)
+            headers["X-Profile-Id"] = trace.id
+        elif profile_skipped:
+            headers["X-Profile-Skipped"] = profile_skipped
+        return JSONResponse(content=response, headers=headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Failed requests keep their partial trace; this is a no-op once finished
+        if trace.enabled and not trace.finished:
+            PROFILER.finish(trace, failed=True)
+
+@app.post("/screen")
+async def screen(
+    files: List[UploadFile] = File(...),
+    stride: int = screening.SCREEN_STRIDE,
+    threshold: float = screening.SCREEN_THRESHOLD,
+    x_api_key: str = Header(None)
+):
+    """
+    Sliding-window screening of whole CT slices (DICOM, one or more per request).
+    Returns non-overlapping detections and a probability-map overlay per slice.
+    """
+    if not 8 <= stride <= screening.WINDOW:
+        raise HTTPException(status_code=400, detail=f"stride must be between 8 and {screening.WINDOW}")
+    
+    slices = []
+    for file in files:
+        inspect_dicom_upload(file)
+        try:
+            hu, raw, info = await run_in_threadpool(screening.read_dicom, file.file)
+            screen_state = await run_in_threadpool(screening.SliceScreen, hu, raw, stride=stride)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not read {file.filename}: {e}")
+        slices.append((file.filename, info, screen_state))
+    
+    await wait_for_model()
+    
+    # Large chunks amortise tile preprocessing; the scheduler queues each one as
+    # max_batch pieces so interactive uploads run between them
+    batch_size = screening.SCREEN_BATCH_SIZE
+    
+    results = []
+    tiles_total = tiles_scored = 0
+    model_version = active_model_version()
+    start = datetime.now()
+    for filename, info, screen_state in slices:
+        for chunk in screen_state.chunks(batch_size):
+            batch = await run_in_threadpool(screen_state.build_batch, chunk, IMG_SIZE)
+            # Bulk work: queued behind interactive uploads
+            outputs, model_version = await schedule(batch, BATCH, x_api_key or ANONYMOUS)
+            screen_state.add_scores(chunk, outputs)
+        screen_state.release()
+        
+        heatmap_filename = f"{uuid.uuid4()}.jpg"
+        save_heatmap(os.path.join(HEATMAP_DIR, heatmap_filename), screening.render_probability_map(screen_state))
+        tiles_total += screen_state.tiles_total
+        tiles_scored += screen_state.tiles_scored
+        results.append({
+            "filename": filename,
+            **info,
+            "tiles_total": screen_state.tiles_total,
+            "tiles_scored": screen_state.tiles_scored,
+            "detections": screen_state.detections(threshold),
+            "heatmap_url": f"/heatmap/{heatmap_filename}"
+        })
+    
+    seconds = (datetime.now() - start).total_seconds()
+    print(f"🔎 Screened {len(results)} slices: {tiles_scored}/{tiles_total} tiles in {seconds:.2f}s")
+    return {
+        "model_version": model_version,
+        "window": screening.WINDOW,
+        "stride": stride,
+        "slices": results,
+        "tiles_total": tiles_total,
+        "tiles_scored": tiles_scored,
+        "seconds": round(seconds, 3),
+        "tiles_per_sec": round(tiles_scored / seconds, 1) if seconds > 0 else 0.0
+    }
 
 @app.get("/heatmap/{filename}")
 async def get_heatmap(filename: str):
@@ -178,7 +647,7 @@ async def get_heatmap(filename: str):
     return FileResponse(file_path, media_type="image/jpeg")
 
 @app.get("/predictions")
-async def get_predictions(limit: int = 10, db: Session = Depends(get_db)):
+def get_predictions(limit: int = 10, db: Session = Depends(get_db)):
     """Get recent predictions from database."""
     predictions = db.query(PredictionLog).order_by(
         PredictionLog.timestamp.desc()
@@ -186,37 +655,242 @@ async def get_predictions(limit: int = 10, db: Session = Depends(get_db)):
     
     return {
         "count": len(predictions),
-        "predictions": [
-            {
-                "id": p.id,
-                "timestamp": p.timestamp.isoformat(),
-                "filename": p.input_filename,
-                "prediction": p.prediction_result,
-                "confidence": round(p.confidence_score * 100, 2)
-            }
-            for p in predictions
-        ]
+        "predictions": [prediction_summary(p) for p in predictions]
     }
 
+@app.get("/predictions/{prediction_id}/similar")
+def get_similar_predictions(
+    prediction_id: int,
+    k: int = 5,
+    exact: bool = False,
+    nprobe: int = Query(16, ge=1),
+    db: Session = Depends(get_db)
+):
+    """Past predictions whose embeddings are closest to this one (runs on the threadpool)."""
+    target = db.query(PredictionLog).filter(PredictionLog.id == prediction_id).first()
+    if target is None:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    
+    index = get_embedding_index(target.model_version)
+    vector = index.vector(prediction_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="No embedding stored for this prediction")
+    
+    k = max(1, min(k, 100))
+    fetch = k
+    for _ in range(5):
+        neighbors = index.search(vector, k=fetch, exclude_id=prediction_id, nprobe=nprobe, exact=exact)
+        rows = {
+            p.id: p for p in db.query(PredictionLog).filter(
+                PredictionLog.id.in_([item_id for item_id, _ in neighbors])
+            )
+        }
+        # Rows archived before the index kept tombstones: retire them and look further
+        missing = [item_id for item_id, _ in neighbors if item_id not in rows]
+        if missing:
+            index.remove(missing)
+        if len(neighbors) - len(missing) >= k or len(neighbors) < fetch:
+            break
+        fetch = min(fetch * 4, 1000)
+    similar = [
+        {
+            "id": item_id,
+            "similarity": round(similarity, 4),
+            "timestamp": rows[item_id].timestamp.isoformat(),
+            "filename": rows[item_id].input_filename,
+            "prediction": rows[item_id].prediction_result,
+            "confidence": round(rows[item_id].confidence_score * 100, 2),
+            "heatmap_url": f"/heatmap/{rows[item_id].heatmap_filename}"
+        }
+        for item_id, similarity in neighbors if item_id in rows
+    ][:k]
+    
+    return {
+        "prediction_id": prediction_id,
+        "model_version": target.model_version,
+        "count": len(similar),
+        "similar": similar
+    }
+
+@app.post("/predictions/index/build", dependencies=[Depends(require_admin)])
+async def build_similarity_index(nlist: int = 1024, m: int = 16):
+    """Train IVF-PQ for the active model's embedding index."""
+    index = get_embedding_index(active_model_version())
+    try:
+        await run_in_threadpool(index.build_ivf, nlist, m)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"model_version": active_model_version(), **index.stats()}
+
 @app.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    """Get prediction statistics."""
-    total = db.query(PredictionLog).count()
-    benign = db.query(PredictionLog).filter(
-        PredictionLog.prediction_result == "Benign"
-    ).count()
-    malignant = db.query(PredictionLog).filter(
-        PredictionLog.prediction_result == "Malignant"
-    ).count()
+def get_stats(db: Session = Depends(get_db)):
+    """Get prediction statistics, including predictions moved to the archive."""
+    return compute_stats(db)
+
+@app.get("/events")
+async def stream_events():
+    """
+    Server-sent events for the dashboard: a `snapshot` event with /stats
+    and the latest predictions, then a `prediction` event with updated
+    stats each time a prediction is logged.
+    """
+    subscription = EVENTS.subscribe()
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Too many event subscribers", headers={"Retry-After": "5"})
+    if not EVENTS.seeded:
+        try:
+            await EVENTS.ensure_seeded(read_dashboard_state)
+        except Exception:
+            EVENTS.unsubscribe(subscription)
+            raise
+    return StreamingResponse(
+        EVENTS.stream(subscription),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def compute_stats(db, through_id=None):
+    """Counts per result over live rows (optionally only up to `through_id`) plus archived roll-ups."""
+    live_query = db.query(PredictionLog.prediction_result, func.count(PredictionLog.id))
+    if through_id is not None:
+        live_query = live_query.filter(PredictionLog.id <= through_id)
+    live = dict(live_query.group_by(PredictionLog.prediction_result).all())
+    archived = dict(db.query(PredictionRollup.prediction_result, func.sum(PredictionRollup.count)).group_by(
+        PredictionRollup.prediction_result
+    ).all())
+    benign = live.get("Benign", 0) + (archived.get("Benign") or 0)
+    malignant = live.get("Malignant", 0) + (archived.get("Malignant") or 0)
+    total = sum(live.values()) + sum(v or 0 for v in archived.values())
     
     return {
         "total_predictions": total,
         "benign_count": benign,
         "malignant_count": malignant,
         "benign_percentage": round((benign / total * 100) if total > 0 else 0, 2),
-        "malignant_percentage": round((malignant / total * 100) if total > 0 else 0, 2)
+        "malignant_percentage": round((malignant / total * 100) if total > 0 else 0, 2),
+        "live_predictions": sum(live.values()),
+        "archived_predictions": sum(v or 0 for v in archived.values())
     }
 
+@app.post("/predictions/archive", dependencies=[Depends(require_admin)])
+async def archive_predictions(days: int = None):
+    """Run the retention job now: archive predictions older than `days` (default RETENTION_DAYS)."""
+    try:
+        summary = await run_in_threadpool(
+            retention.run_retention, retention.RETENTION_DAYS if days is None else days
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    if summary is None:
+        raise HTTPException(status_code=409, detail="Retention job already running")
+    return summary
+
+@app.get("/scheduler")
+async def scheduler_stats():
+    """Per-class queue depth, wait times, shed counts and batch sizes."""
+    return SCHEDULER.stats()
+
+# ========== Model Registry Endpoints ==========
+# The registry is per process: these calls change only the worker that
+# handles them, so with --workers > 1 configure versions through
+# MODEL_VERSION / EXTRA_MODELS / SHADOW_MODEL and restart instead.
+
+def require_local_models():
+    """Hot-swap needs the models in this process, which shared mode doesn't have."""
+    if SERVING_MODE == "shared":
+        raise HTTPException(
+            status_code=409,
+            detail="Model hot-swap is not available with SERVING_MODE=shared: "
+                   "restart inference_server.py with the new MODEL_PATH / MODEL_VERSION"
+        )
+
+MODEL_ADMIN = [Depends(require_admin), Depends(require_local_models)]
+
+@app.get("/models")
+async def list_models():
+    """Loaded model versions, active/shadow assignment and per-model latency."""
+    return REGISTRY.status()
+
+@app.post("/models/{version}/load", dependencies=MODEL_ADMIN)
+async def load_model(version: str, filename: str):
+    """Load a model file from MODEL_DIR without activating it."""
+    path = os.path.join(MODEL_DIR, os.path.basename(filename))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Model file not found")
+    try:
+        entry = await run_in_threadpool(load_model_version, version, path)
+    except Exception as e:
+        print(f"❌ Error loading {version}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": entry.version, "path": entry.path, "loaded_at": entry.loaded_at.isoformat()}
+
+@app.post("/models/{version}/activate", dependencies=MODEL_ADMIN)
+async def activate_model(version: str):
+    """Atomically switch serving traffic to a loaded version."""
+    try:
+        REGISTRY.activate(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model {version} not loaded")
+    print(f"🔄 Active model is now {version}")
+    return REGISTRY.status()
+
+@app.post("/models/{version}/shadow", dependencies=MODEL_ADMIN)
+async def shadow_model(version: str, sample_rate: float = 0.1):
+    """Score a sampled fraction of traffic with a candidate version."""
+    try:
+        REGISTRY.set_shadow(version, sample_rate)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model {version} not loaded")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return REGISTRY.status()
+
+@app.delete("/models/shadow", dependencies=MODEL_ADMIN)
+async def clear_shadow_model():
+    """Stop shadow scoring."""
+    REGISTRY.clear_shadow()
+    return REGISTRY.status()
+
+@app.delete("/models/{version}", dependencies=MODEL_ADMIN)
+async def unload_model(version: str):
+    """Drop a non-active version from memory."""
+    try:
+        REGISTRY.unload(version)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return REGISTRY.status()
+
+# ========== Profiling Endpoints ==========
+
+@app.post("/profiling/arm", dependencies=[Depends(require_admin)])
+async def arm_profiling(requests: int = 1):
+    """Profile the next N /predict requests handled by this worker (max 10)."""
+    return {"armed": PROFILER.arm(requests)}
+
+@app.get("/profiling", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Stored profiles, newest first."""
+    return {"profiles": PROFILER.list()}
+
+@app.get("/profiling/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    """Per-stage trace: durations, tracemalloc deltas and top allocation sites."""
+    path = PROFILER.path_for(profile_id, ".json")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json")
+
+@app.get("/profiling/{profile_id}/folded", dependencies=[Depends(require_admin)])
+async def get_profile_folded(profile_id: str):
+    """Sampled stacks in folded format, for flamegraph.pl / speedscope."""
+    path = PROFILER.path_for(profile_id, ".folded")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,204 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+
+# ========== Latency Tracking ==========
+
+class LatencyTracker:
+    """Rolling window of inference latencies for one model version."""
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = np.array(self._samples) * 1000.0
+            count = self._count
+        if samples.size == 0:
+            return {"count": count, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            "count": count,
+            "mean_ms": round(float(samples.mean()), 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+        }
+
+# ========== Registry ==========
+
+class ModelEntry:
+    """A loaded, warmed-up model version."""
+
+    def __init__(self, version, path, model, predict_fn, scorer, embedding_dim=0):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.predict_fn = predict_fn
+        self.embedding_dim = embedding_dim
+        self._scorer = scorer
+        self.loaded_at = datetime.now()
+        self.warmup_timings = {}
+        self.latency = LatencyTracker()
+
+    @property
+    def output_width(self):
+        """Columns per row returned by `predict` (score + embedding)."""
+        return 1 + self.embedding_dim
+
+    def predict(self, img_array):
+        """
+        Score a uint8 NHWC batch and record the latency against this version.
+        Returns (N, 1 + embedding_dim): score in column 0, embedding after it.
+        """
+        start = time.perf_counter()
+        scores = self._scorer(img_array)
+        self.latency.record(time.perf_counter() - start)
+        return scores
+
+
+class ModelRegistry:
+    """
+    Holds every loaded model version and which one is serving.
+
+    Swapping the active version is a single reference assignment under a
+    lock, so a request that already fetched `active()` finishes on the
+    version it started with while new requests pick up the new one.
+
+    The registry lives in one process: with several uvicorn workers each
+    has its own, and in shared mode the models live in the inference server.
+    """
+
+    def __init__(self, img_size, shadow_max_pending=16):
+        self.img_size = img_size
+        self._models = {}
+        self._active = None
+        self._shadow = None
+        self._shadow_rate = 0.0
+        self._lock = threading.Lock()
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        # Shadow jobs queued or running; past the cap new samples are dropped
+        self.shadow_max_pending = shadow_max_pending
+        self._shadow_pending = 0
+        self.shadow_dropped = 0
+
+    def load(self, version, path):
+        """Load, compile and warm up a model version (does not activate it)."""
+        # TensorFlow is imported here, not at module level, so shared-mode
+        # HTTP workers that never load a model never pay for the runtime
+        from tensorflow import keras
+        from inference import build_predict_fn, run_predict, warm_up
+
+        model = keras.models.load_model(path)
+        predict_fn, embedding_dim = build_predict_fn(model, self.img_size)
+        timings = warm_up(predict_fn, self.img_size)
+        entry = ModelEntry(version, path, model, predict_fn, partial(run_predict, predict_fn), embedding_dim)
+        entry.warmup_timings = timings
+        with self._lock:
+            self._models[version] = entry
+        return entry
+
+    def unload(self, version):
+        with self._lock:
+            if self._active is not None and self._active.version == version:
+                raise ValueError(f"Cannot unload active model {version}")
+            if self._shadow is not None and self._shadow.version == version:
+                self._shadow = None
+                self._shadow_rate = 0.0
+            self._models.pop(version, None)
+
+    def activate(self, version):
+        with self._lock:
+            if version not in self._models:
+                raise KeyError(version)
+            self._active = self._models[version]
+            return self._active
+
+    def active(self):
+        return self._active
+
+    def get(self, version):
+        return self._models.get(version)
+
+    # ---------- Shadow scoring ----------
+
+    def set_shadow(self, version, sample_rate):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        with self._lock:
+            if version not in self._models:
+                raise KeyError(version)
+            self._shadow = self._models[version]
+            self._shadow_rate = sample_rate
+
+    def clear_shadow(self):
+        with self._lock:
+            self._shadow = None
+            self._shadow_rate = 0.0
+
+    def maybe_shadow(self, img_array, on_result):
+        """
+        Score a sampled fraction of traffic with the shadow model.
+
+        Runs on a background thread, off the request path; `on_result` is
+        called there with (version, raw_score, latency_seconds). When the
+        shadow model can't keep up, samples beyond `shadow_max_pending` are
+        dropped (and counted) rather than queued without bound.
+        """
+        shadow = self._shadow
+        if shadow is None or shadow is self._active or random.random() >= self._shadow_rate:
+            return None
+        with self._lock:
+            if self._shadow_pending >= self.shadow_max_pending:
+                self.shadow_dropped += 1
+                return None
+            self._shadow_pending += 1
+
+        def score():
+            try:
+                start = time.perf_counter()
+                raw_score = float(shadow.predict(img_array)[0][0])
+                on_result(shadow.version, raw_score, time.perf_counter() - start)
+            finally:
+                with self._lock:
+                    self._shadow_pending -= 1
+
+        return self._shadow_executor.submit(score)
+
+    def status(self):
+        active, shadow = self._active, self._shadow
+        return {
+            "active": active.version if active else None,
+            "shadow": shadow.version if shadow else None,
+            "shadow_sample_rate": self._shadow_rate if shadow else 0.0,
+            "shadow_pending": self._shadow_pending,
+            "shadow_dropped": self.shadow_dropped,
+            "worker_pid": os.getpid(),
+            "models": [
+                {
+                    "version": entry.version,
+                    "path": entry.path,
+                    "loaded_at": entry.loaded_at.isoformat(),
+                    "embedding_dim": entry.embedding_dim,
+                    "latency": entry.latency.snapshot(),
+                }
+                for entry in list(self._models.values())
+            ],
+        }
+
+    def shutdown(self):
+        self._shadow_executor.shutdown(wait=False)
@@ -0,0 +1,276 @@
+"""
+On-demand profiling of single /predict requests.
+
+A request is profiled when it carries `X-Profile: 1` (rate-limited to one
+every PROFILE_MIN_INTERVAL_S) or when an admin has armed the next few
+requests. A profiled request gets:
+
+- a per-stage trace (decode, preprocess, model, heatmap, ...) with wall
+  time and tracemalloc allocation deltas,
+- a stack-sampling profile of every busy thread in the worker (the event
+  loop plus the threadpool threads running the model, DB commit and
+  index append), saved in folded format (`thread;frame;frame count`),
+  which flamegraph.pl, speedscope and inferno read directly.
+
+Unprofiled requests get NO_TRACE, whose stages are a shared no-op
+context manager: no timers, no tracemalloc, no sampler thread.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
+
+# ========== Settings ==========
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MIN_INTERVAL_S = float(os.getenv("PROFILE_MIN_INTERVAL_S", "10"))
+PROFILE_SAMPLE_INTERVAL_S = float(os.getenv("PROFILE_SAMPLE_INTERVAL_S", "0.001"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_MAX_ARMED = 10
+PROFILE_HEADER_VALUES = {"1", "true", "yes"}
+
+
+def profile_requested(header):
+    """True only for an explicit X-Profile: 1 / true / yes (so "0" or "false" don't profile)."""
+    return header is not None and header.strip().lower() in PROFILE_HEADER_VALUES
+
+# ========== Traces ==========
+
+class _NullTrace:
+    """Stand-in for unprofiled requests; every call is a no-op."""
+
+    enabled = False
+    _stage = nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+
+NO_TRACE = _NullTrace()
+
+
+class _Stage:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.memory_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current, peak = tracemalloc.get_traced_memory()
+        self.trace.stages.append({
+            "stage": self.name,
+            "ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "alloc_delta_kb": round((current - self.memory_start) / 1024, 1),
+            "alloc_peak_kb": round((peak - self.memory_start) / 1024, 1),
+            "error": exc_type.__name__ if exc_type else None,
+        })
+        return False
+
+
+def _is_idle(frame):
+    """True for a pool thread parked waiting for work (anyio / concurrent.futures workers)."""
+    code = frame.f_code
+    if code.co_name == "_worker" and code.co_filename.endswith(os.path.join("futures", "thread.py")):
+        return True
+    caller = frame.f_back
+    return (code.co_name == "wait" and code.co_filename.endswith("threading.py")
+            and caller is not None and caller.f_code.co_name == "get"
+            and caller.f_code.co_filename.endswith("queue.py"))
+
+
+class _Sampler(threading.Thread):
+    """Samples every busy thread's Python stack at a fixed interval."""
+
+    def __init__(self, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._names = {}
+
+    def _thread_name(self, thread_id):
+        if thread_id not in self._names:
+            self._names = {t.ident: t.name for t in threading.enumerate()}
+        return self._names.get(thread_id, f"thread-{thread_id}")
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(self._thread_name(thread_id))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestTrace:
+    """Stage timings, allocations and stack samples for one request."""
+
+    enabled = True
+
+    def __init__(self, path, trigger, sample_interval=PROFILE_SAMPLE_INTERVAL_S):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.now()
+        self.stages = []
+        self.sample_interval = sample_interval
+        self.finished = False
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        self._sampler = _Sampler(sample_interval)
+        self._sampler.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def finish(self, top_allocations=10):
+        """Stop sampling and tracing; returns the trace as a dict."""
+        self.finished = True
+        total_ms = (time.perf_counter() - self._start) * 1000
+        self._sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        top = snapshot.statistics("lineno")[:top_allocations]
+        return {
+            "id": self.id,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": round(total_ms, 3),
+            "stages": self.stages,
+            "samples": self._sampler.samples,
+            "sample_interval_ms": self.sample_interval * 1000,
+            "top_allocations": [
+                {"location": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in top
+            ],
+        }
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self._sampler.stacks.most_common())
+
+# ========== Profiler ==========
+
+class Profiler:
+    """
+    Decides which requests get profiled and stores finished profiles.
+
+    At most one request per worker is profiled at a time. Header-triggered
+    profiles are rate-limited; armed ones are capped at PROFILE_MAX_ARMED.
+    Numbers cover everything the worker did meanwhile, including other
+    requests interleaved on the same event loop or sharing a batch.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, min_interval=PROFILE_MIN_INTERVAL_S, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.min_interval = min_interval
+        self.keep = keep
+        self.armed = 0
+        self._active = False
+        self._last_started = None
+        self._lock = threading.Lock()
+
+    def arm(self, count):
+        with self._lock:
+            self.armed = max(0, min(count, PROFILE_MAX_ARMED))
+        return self.armed
+
+    def start(self, path, requested=False):
+        """
+        Returns (trace, skipped_reason): a RequestTrace if this request
+        should be profiled, otherwise NO_TRACE plus why a requested profile
+        was skipped.
+        """
+        if not requested and not self.armed:
+            return NO_TRACE, None
+        with self._lock:
+            if self._active:
+                return NO_TRACE, "busy"
+            if self.armed:
+                self.armed -= 1
+                trigger = "armed"
+            else:
+                now = time.monotonic()
+                if self._last_started is not None and now - self._last_started < self.min_interval:
+                    return NO_TRACE, "rate-limited"
+                self._last_started = now
+                trigger = "header"
+            self._active = True
+        try:
+            return RequestTrace(path, trigger), None
+        except Exception:
+            self._active = False
+            raise
+
+    def finish(self, trace, **extra):
+        """Finish a trace and save it as <id>.json and <id>.folded."""
+        if not trace.enabled:
+            return None
+        try:
+            result = {**trace.finish(), **extra}
+            folded = trace.folded()
+        finally:
+            self._active = False
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{trace.id}.folded"), "w") as f:
+            f.write(folded)
+        with open(os.path.join(self.directory, f"{trace.id}.json"), "w") as f:
+            json.dump(result, f, indent=2)
+        self._prune()
+        print(f"🔬 Profiled {trace.path} in {result['total_ms']:.1f}ms ({result['samples']} samples) -> {trace.id}")
+        return result
+
+    def _prune(self):
+        traces = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith(".json")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entry in traces[:-self.keep] if self.keep else traces:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(entry.path[:-len(".json")] + suffix)
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in sorted(os.scandir(self.directory), key=lambda e: -e.stat().st_mtime):
+            if entry.name.endswith(".json"):
+                with open(entry.path) as f:
+                    data = json.load(f)
+                profiles.append({k: data.get(k) for k in ("id", "path", "trigger", "started_at", "total_ms")})
+        return profiles
+
+    def path_for(self, profile_id, suffix):
+        """File path for a stored profile, or None (ids are hex, so no traversal)."""
+        if not profile_id.isalnum():
+            return None
+        path = os.path.join(self.directory, profile_id + suffix)
+        return path if os.path.exists(path) else None
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+# ========== Readiness State Machine ==========
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """
+    Tracks background model loading: loading -> ready, or loading -> failed.
+
+    Requests that need the model await `wait()` instead of failing while the
+    server is still booting.
+    """
+
+    def __init__(self):
+        self.state = LOADING
+        self.error = None
+        self.started_at = time.monotonic()
+        self.ready_after_s = None
+        self._event = None
+
+    def _get_event(self):
+        # Created lazily so it binds to the running event loop
+        if self._event is None:
+            self._event = asyncio.Event()
+        return self._event
+
+    def reset(self):
+        self.state = LOADING
+        self.error = None
+        self.started_at = time.monotonic()
+        self.ready_after_s = None
+        self._event = asyncio.Event()
+
+    def mark_ready(self):
+        self.state = READY
+        self.ready_after_s = time.monotonic() - self.started_at
+        self._get_event().set()
+
+    def mark_failed(self, error):
+        self.state = FAILED
+        self.error = str(error)
+        self._get_event().set()
+
+    @property
+    def is_ready(self):
+        return self.state == READY
+
+    async def wait(self, timeout):
+        """Wait up to `timeout` seconds for loading to finish; True if ready."""
+        if self.state == LOADING:
+            try:
+                await asyncio.wait_for(self._get_event().wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return self.state == READY
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "ready_after_s": round(self.ready_after_s, 3) if self.ready_after_s is not None else None,
+            "uptime_s": round(time.monotonic() - self.started_at, 3),
+        }
@@ -0,0 +1,215 @@
+"""
+Retention job: move old prediction logs out of the serving database.
+
+Rows older than RETENTION_DAYS are written to Parquet, partitioned by
+day (ARCHIVE_DIR/predictions/dt=YYYY-MM-DD/), folded into daily
+aggregates in `prediction_rollups` and deleted from `predictions` in
+small batches so `/predict` inserts never wait behind one huge delete.
+Shadow scores for those rows go to ARCHIVE_DIR/shadow_predictions/,
+and their embeddings are tombstoned in the similar-case index.
+Use analytics.py to query the archive.
+
+    python retention.py --days 90
+"""
+import fcntl
+import os
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import func
+
+from database import SessionLocal, PredictionLog, PredictionRollup, ShadowPredictionLog
+from vector_index import VectorIndex, index_directory
+
+# ========== Settings ==========
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+# How often the API runs the job in the background (0 = never)
+RETENTION_INTERVAL_S = float(os.getenv("RETENTION_INTERVAL_S", "3600"))
+
+PREDICTION_COLUMNS = ["id", "timestamp", "input_filename", "prediction_result", "confidence_score",
+                      "raw_score", "heatmap_filename", "model_version"]
+SHADOW_COLUMNS = ["id", "prediction_id", "timestamp", "model_version", "raw_score", "latency_ms"]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("The retention job needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def _schemas(pa):
+    predictions = pa.schema([
+        ("id", pa.int64()), ("timestamp", pa.timestamp("us")), ("input_filename", pa.string()),
+        ("prediction_result", pa.string()), ("confidence_score", pa.float64()),
+        ("raw_score", pa.float64()), ("heatmap_filename", pa.string()), ("model_version", pa.string()),
+    ])
+    shadow = pa.schema([
+        ("id", pa.int64()), ("prediction_id", pa.int64()), ("timestamp", pa.timestamp("us")),
+        ("model_version", pa.string()), ("raw_score", pa.float64()), ("latency_ms", pa.float64()),
+    ])
+    return predictions, shadow
+
+# ========== Export ==========
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _write_parquet(pa, path, schema, rows, columns):
+    """Write rows (tuples) to one Parquet file atomically (tmp + rename)."""
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    arrays = {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+    pq.write_table(pa.Table.from_pydict(arrays, schema=schema), tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def _roll_up(db, rows):
+    """Add a batch of prediction rows to the daily aggregates."""
+    groups = {}
+    for row in rows:
+        key = (row.timestamp.date(), row.model_version or "unknown", row.prediction_result)
+        groups.setdefault(key, []).append(row)
+    for (day, version, result), members in groups.items():
+        rollup = db.query(PredictionRollup).filter_by(
+            day=day, model_version=version, prediction_result=result
+        ).first()
+        if rollup is None:
+            rollup = PredictionRollup(day=day, model_version=version, prediction_result=result,
+                                      count=0, raw_score_sum=0.0, confidence_sum=0.0)
+            db.add(rollup)
+        scores = [m.raw_score for m in members]
+        rollup.count += len(members)
+        rollup.raw_score_sum += sum(scores)
+        rollup.confidence_sum += sum(m.confidence_score for m in members)
+        rollup.raw_score_min = min(scores + ([rollup.raw_score_min] if rollup.raw_score_min is not None else []))
+        rollup.raw_score_max = max(scores + ([rollup.raw_score_max] if rollup.raw_score_max is not None else []))
+
+
+def _remove_embeddings(rows, indexes, embedding_dir):
+    """Tombstone the batch's embeddings so similar-case search stops returning them."""
+    by_version = {}
+    for row in rows:
+        by_version.setdefault(row.model_version, []).append(row.id)
+    for version, ids in by_version.items():
+        if version not in indexes:
+            directory = index_directory(version, embedding_dir)
+            # Don't create an index for versions that never stored embeddings
+            indexes[version] = VectorIndex(directory) if os.path.exists(
+                os.path.join(directory, "meta.json")) else None
+        if indexes[version] is not None:
+            indexes[version].remove(ids)
+
+
+def archive_day(db, day, archive_dir=ARCHIVE_DIR, batch_size=RETENTION_BATCH_SIZE, embedding_dir=None):
+    """
+    Move one day's predictions (and their shadow scores) to Parquet, batch
+    by batch.
+
+    Each batch is written to part-<first id>.parquet, then rolled up and
+    deleted in one transaction, so a row is always counted exactly once:
+    live or rolled up. After a crash between the write and the commit,
+    the re-run's batch starts at the same id (everything before it is
+    gone, and ids only grow) and overwrites that file instead of adding
+    a second copy of its rows. Embeddings are tombstoned before the
+    commit, so search never returns a row that is already gone.
+    """
+    pa = _require_pyarrow()
+    prediction_schema, shadow_schema = _schemas(pa)
+    start, end = _day_bounds(day)
+    in_day = (PredictionLog.timestamp >= start, PredictionLog.timestamp < end)
+
+    last_id = db.query(func.max(PredictionLog.id)).filter(*in_day).scalar()
+    if last_id is None:
+        return 0
+    partition = f"dt={day.isoformat()}"
+    # Late inserts with an old timestamp wait for the next run
+    in_day += (PredictionLog.id <= last_id,)
+
+    archived = 0
+    indexes = {}
+    while True:
+        rows = db.query(PredictionLog).filter(*in_day).order_by(PredictionLog.id).limit(batch_size).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        filename = f"part-{ids[0]}.parquet"
+
+        shadow_rows = (db.query(*[getattr(ShadowPredictionLog, c) for c in SHADOW_COLUMNS])
+                       .filter(ShadowPredictionLog.prediction_id.in_(ids))
+                       .order_by(ShadowPredictionLog.id).all())
+        if shadow_rows:
+            _write_parquet(pa, os.path.join(archive_dir, "shadow_predictions", partition, filename),
+                           shadow_schema, shadow_rows, SHADOW_COLUMNS)
+        _write_parquet(pa, os.path.join(archive_dir, "predictions", partition, filename),
+                       prediction_schema, [tuple(getattr(r, c) for c in PREDICTION_COLUMNS) for r in rows],
+                       PREDICTION_COLUMNS)
+
+        _roll_up(db, rows)
+        _remove_embeddings(rows, indexes, embedding_dir)
+        db.query(ShadowPredictionLog).filter(
+            ShadowPredictionLog.prediction_id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.query(PredictionLog).filter(PredictionLog.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        archived += len(ids)
+
+    return archived
+
+
+def run_retention(retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR,
+                  batch_size=RETENTION_BATCH_SIZE, now=None, embedding_dir=None):
+    """
+    Archive every whole day older than `retention_days`, oldest first.
+    Returns {"days": [...], "rows": n}, or None if another process holds
+    the retention lock.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, ".retention.lock"), "w") as lock_file:
+        try:
+            # One job per node, however many uvicorn workers schedule it
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+
+        cutoff = datetime.combine((now or datetime.utcnow()).date() - timedelta(days=retention_days), time.min)
+        summary = {"cutoff": cutoff.isoformat(), "days": [], "rows": 0}
+        db = SessionLocal()
+        try:
+            while True:
+                oldest = db.query(func.min(PredictionLog.timestamp)).filter(
+                    PredictionLog.timestamp < cutoff
+                ).scalar()
+                if oldest is None:
+                    break
+                rows = archive_day(db, oldest.date(), archive_dir, batch_size, embedding_dir)
+                summary["days"].append({"day": oldest.date().isoformat(), "rows": rows})
+                summary["rows"] += rows
+        finally:
+            db.close()
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Archive old prediction logs to Parquet")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Keep this many days live")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    args = parser.parse_args()
+
+    result = run_retention(args.days, args.archive_dir, args.batch_size)
+    if result is None:
+        print("⏭️ Another retention job is running")
+    else:
+        print(json.dumps(result, indent=2))
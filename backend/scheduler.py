@@ -0,0 +1,332 @@
+"""
+Priority- and deadline-aware scheduling in front of model execution.
+
+Every scoring call goes through one InferenceScheduler per worker:
+
+- two priority classes: "interactive" (clinician uploads from the
+  frontend) always dispatches before "batch" (bulk API scoring), with a
+  small guaranteed share for batch so it never starves;
+- per-API-key fair queuing inside each class (deficit round robin,
+  costed in images, so a 10-view TTA request pays for 10);
+- per-request deadlines: requests are rejected up front when the current
+  backlog can't meet them, and dropped unexecuted if they expire queued;
+- a bounded queue per class (admission control);
+- micro-batching: whatever is at the head of the queues is scored in
+  one forward pass of up to SCHEDULER_MAX_BATCH images. Bigger requests
+  (screening chunks) are queued as max_batch pieces, so interactive work
+  gets in between them instead of waiting out one long pass.
+"""
+import asyncio
+import os
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from model_registry import LatencyTracker
+
+# ========== Settings ==========
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, BATCH)
+
+SCHEDULER_MAX_BATCH = int(os.getenv("SCHEDULER_MAX_BATCH", "16"))
+# Forward passes in flight at once (raise for shared mode, which has several ring slots)
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "1"))
+# Images each API key may send per round-robin turn
+SCHEDULER_QUANTUM = int(os.getenv("SCHEDULER_QUANTUM", "8"))
+# While batch work waits, at least one dispatch in this many leads with batch
+SCHEDULER_BATCH_EVERY = int(os.getenv("SCHEDULER_BATCH_EVERY", "8"))
+DEFAULT_DEADLINE_MS = {
+    INTERACTIVE: float(os.getenv("SCHEDULER_INTERACTIVE_DEADLINE_MS", "2000")),
+    BATCH: float(os.getenv("SCHEDULER_BATCH_DEADLINE_MS", "30000")),
+}
+MAX_QUEUE = {
+    INTERACTIVE: int(os.getenv("SCHEDULER_INTERACTIVE_MAX_QUEUE", "64")),
+    BATCH: int(os.getenv("SCHEDULER_BATCH_MAX_QUEUE", "512")),
+}
+# Fair-queue keys for unkeyed traffic: dashboard uploads, everyone else
+FRONTEND = "frontend"
+ANONYMOUS = "anonymous"
+
+
+class SchedulerRejected(Exception):
+    """A request was shed; `reason` is queue_full, deadline_unmeetable or deadline_expired."""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Request:
+    __slots__ = ("images", "cost", "key", "priority", "deadline", "enqueued_at", "future")
+
+    def __init__(self, images, key, priority, deadline, enqueued_at, future):
+        self.images = images
+        self.cost = len(images)
+        self.key = key
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued_at = enqueued_at
+        self.future = future
+
+# ========== Fair Queue ==========
+
+class FairQueue:
+    """Deficit round robin over per-key FIFOs, costed in images."""
+
+    def __init__(self, quantum=SCHEDULER_QUANTUM):
+        self.quantum = quantum
+        self.queues = OrderedDict()
+        self.active = deque()
+        self.deficit = {}
+        self.depth = 0
+        self.images = 0
+
+    def __len__(self):
+        return self.depth
+
+    def push(self, request):
+        queue = self.queues.get(request.key)
+        if queue is None:
+            queue = self.queues[request.key] = deque()
+            self.active.append(request.key)
+            self.deficit[request.key] = self.quantum
+        queue.append(request)
+        self.depth += 1
+        self.images += request.cost
+
+    def push_front(self, request):
+        """Undo a pop: the request goes back to the head of its key's turn."""
+        queue = self.queues.get(request.key)
+        if queue is None:
+            queue = self.queues[request.key] = deque()
+            self.deficit[request.key] = 0
+        else:
+            self.active.remove(request.key)
+        self.active.appendleft(request.key)
+        queue.appendleft(request)
+        self.deficit[request.key] += request.cost
+        self.depth += 1
+        self.images += request.cost
+
+    def pop(self):
+        while self.active:
+            key = self.active[0]
+            queue = self.queues[key]
+            if queue[0].cost <= self.deficit[key]:
+                request = queue.popleft()
+                self.deficit[key] -= request.cost
+                if not queue:
+                    del self.queues[key]
+                    del self.deficit[key]
+                    self.active.popleft()
+                self.depth -= 1
+                self.images -= request.cost
+                return request
+            # Turn over: this key goes to the back with a fresh quantum
+            self.deficit[key] += self.quantum
+            self.active.rotate(-1)
+        return None
+
+    def key_depths(self, limit=20):
+        depths = sorted(((k, len(q)) for k, q in self.queues.items()), key=lambda kv: -kv[1])
+        return dict(depths[:limit])
+
+# ========== Scheduler ==========
+
+class InferenceScheduler:
+    """
+    Queues scoring requests and feeds micro-batches to `execute`, an async
+    callable taking a uint8 NHWC batch and returning (outputs, model_version).
+    """
+
+    def __init__(self, execute, max_batch=SCHEDULER_MAX_BATCH, concurrency=SCHEDULER_CONCURRENCY):
+        self.execute = execute
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        self.queues = {cls: FairQueue() for cls in PRIORITY_CLASSES}
+        self.wait_times = {cls: LatencyTracker() for cls in PRIORITY_CLASSES}
+        self.counters = {
+            cls: {"admitted": 0, "completed": 0, "failed": 0,
+                  "shed": {"queue_full": 0, "deadline_unmeetable": 0, "deadline_expired": 0}}
+            for cls in PRIORITY_CLASSES
+        }
+        self.batch_sizes = deque(maxlen=1000)  # images per dispatch
+        self.seconds_per_image = None  # EWMA of forward-pass time per image
+        self.in_flight = 0
+        self.in_flight_images = 0
+        self._batch_streak = 0
+        self._work = None
+        self._slots = None
+
+    async def run(self):
+        """Dispatcher loop; start once per event loop (see main.startup_event)."""
+        self._work = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        if any(self.queues.values()):
+            self._work.set()
+        tasks = set()
+        while True:
+            await self._work.wait()
+            await self._slots.acquire()
+            picked = self._take_batch()
+            if not any(self.queues.values()):
+                self._work.clear()
+            if not picked:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._run_batch(picked))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def submit(self, images, priority=INTERACTIVE, key=None, deadline_ms=None):
+        """Queue a batch of images and wait for (outputs, model_version)."""
+        loop = asyncio.get_running_loop()
+        priority = priority if priority in PRIORITY_CLASSES else INTERACTIVE
+        deadline_s = (deadline_ms if deadline_ms is not None else DEFAULT_DEADLINE_MS[priority]) / 1000.0
+        counters = self.counters[priority]
+        pieces = [images[i:i + self.max_batch] for i in range(0, len(images), self.max_batch)]
+
+        if len(self.queues[priority]) + len(pieces) > MAX_QUEUE[priority]:
+            counters["shed"]["queue_full"] += 1
+            raise SchedulerRejected("queue_full", retry_after=self._retry_after(priority))
+        if self.estimate_wait(priority, len(images)) > deadline_s:
+            counters["shed"]["deadline_unmeetable"] += 1
+            raise SchedulerRejected("deadline_unmeetable", retry_after=self._retry_after(priority))
+
+        now = loop.time()
+        requests = [
+            _Request(piece, key or ANONYMOUS, priority, now + deadline_s, now, loop.create_future())
+            for piece in pieces
+        ]
+        for request in requests:
+            self.queues[priority].push(request)
+        counters["admitted"] += 1
+        if self._work is not None:
+            self._work.set()
+
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*(r.future for r in requests)), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            # Still queued (the dispatcher skips cancelled futures) or stuck behind a slow batch
+            counters["shed"]["deadline_expired"] += 1
+            raise SchedulerRejected("deadline_expired", retry_after=self._retry_after(priority))
+        except SchedulerRejected:
+            counters["shed"]["deadline_expired"] += 1
+            raise
+        except Exception:
+            counters["failed"] += 1
+            raise
+        finally:
+            # One piece failed or expired: don't spend forward passes on the rest
+            for request in requests:
+                if not request.future.done():
+                    request.future.cancel()
+        counters["completed"] += 1
+
+        if len(results) == 1:
+            return results[0]
+        return np.concatenate([outputs for outputs, _ in results]), results[-1][1]
+
+    def estimate_wait(self, priority, cost):
+        """Seconds until a new request of `cost` images would finish, from the current backlog."""
+        if self.seconds_per_image is None:
+            return 0.0
+        ahead = self.queues[INTERACTIVE].images + self.in_flight_images
+        if priority == BATCH:
+            ahead += self.queues[BATCH].images
+        return (ahead + cost) * self.seconds_per_image / self.concurrency
+
+    def _retry_after(self, priority):
+        return max(1, int(np.ceil(self.estimate_wait(priority, 0))))
+
+    def _take_batch(self):
+        """Pick requests for one forward pass: up to max_batch images, at least one request."""
+        batch_waiting = len(self.queues[BATCH]) > 0
+        if batch_waiting and self._batch_streak >= SCHEDULER_BATCH_EVERY:
+            order = (BATCH, INTERACTIVE)
+        else:
+            order = (INTERACTIVE, BATCH)
+
+        loop = asyncio.get_running_loop()
+        picked = []
+        images = 0
+        for cls in order:
+            queue = self.queues[cls]
+            while images < self.max_batch:
+                request = queue.pop()
+                if request is None:
+                    break
+                if request.future.done():
+                    continue  # caller gave up (deadline or disconnect)
+                if loop.time() > request.deadline:
+                    # Counted by submit(), once per call rather than per piece
+                    request.future.set_exception(SchedulerRejected("deadline_expired"))
+                    continue
+                if picked and images + request.cost > self.max_batch:
+                    queue.push_front(request)
+                    break
+                picked.append(request)
+                images += request.cost
+
+        if picked:
+            leads_with_batch = picked[0].priority == BATCH
+            self._batch_streak = 0 if leads_with_batch or not batch_waiting else self._batch_streak + 1
+        return picked
+
+    async def _run_batch(self, picked):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        cost = sum(r.cost for r in picked)
+        for request in picked:
+            self.wait_times[request.priority].record(start - request.enqueued_at)
+        self.in_flight += 1
+        self.in_flight_images += cost
+        try:
+            images = picked[0].images if len(picked) == 1 else np.concatenate([r.images for r in picked])
+            outputs, model_version = await self.execute(images)
+        except Exception as e:
+            for request in picked:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        else:
+            offset = 0
+            for request in picked:
+                if not request.future.done():
+                    request.future.set_result((outputs[offset:offset + request.cost], model_version))
+                offset += request.cost
+            per_image = (loop.time() - start) / cost
+            self.seconds_per_image = per_image if self.seconds_per_image is None \
+                else 0.8 * self.seconds_per_image + 0.2 * per_image
+            self.batch_sizes.append(cost)
+        finally:
+            self.in_flight -= 1
+            self.in_flight_images -= cost
+            self._slots.release()
+
+    def stats(self):
+        sizes = np.array(self.batch_sizes)
+        return {
+            "max_batch": self.max_batch,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "ms_per_image": round(self.seconds_per_image * 1000, 3) if self.seconds_per_image else None,
+            "images_per_batch": {
+                "mean": round(float(sizes.mean()), 2) if sizes.size else None,
+                "p95": float(np.percentile(sizes, 95)) if sizes.size else None,
+            },
+            "classes": {
+                cls: {
+                    "queue_depth": len(self.queues[cls]),
+                    "queued_images": self.queues[cls].images,
+                    "max_queue": MAX_QUEUE[cls],
+                    "default_deadline_ms": DEFAULT_DEADLINE_MS[cls],
+                    "estimated_wait_ms": round(self.estimate_wait(cls, 1) * 1000, 3),
+                    "wait": self.wait_times[cls].snapshot(),
+                    **self.counters[cls],
+                    "queued_by_key": self.queues[cls].key_depths(),
+                }
+                for cls in PRIORITY_CLASSES
+            },
+        }
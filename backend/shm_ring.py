@@ -0,0 +1,408 @@
+"""
+Shared-memory ring buffers between uvicorn workers and the inference server.
+
+One segment per worker. Each segment starts with a control block (layout
+parameters, ready flag, server generation and heartbeat, active model
+version) followed by `slots` fixed-size slots:
+
+    [ state | seq | count | pad ]  int64 header
+    [ inputs  ]  max_batch x H x W x 3 uint8
+    [ outputs ]  max_batch x output_width float32
+
+A worker owns its segment exclusively, writes a preprocessed batch into a
+FREE slot and flips it to READY; the inference server scores every READY
+slot across all segments in one batch and flips them to DONE (or ERROR).
+Only the state word is used for hand-off, so tensors are never pickled or
+copied through a pipe.
+
+A restarted server creates fresh segments under the same names with a new
+generation; workers still mapping the old ones notice the ready flag drop
+or the heartbeat stop and re-attach.
+"""
+import asyncio
+import fcntl
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+RING_NAME = "oncodetect-ring-{}"
+
+# Slot states
+FREE = 0
+READY = 1
+DONE = 2
+ERROR = 3
+
+# Control block: int64 fields followed by the active model version string
+CONTROL_BYTES = 128
+(CTRL_READY, CTRL_SLOTS, CTRL_MAX_BATCH, CTRL_HEIGHT, CTRL_WIDTH, CTRL_OUTPUT_WIDTH,
+ CTRL_GENERATION, CTRL_HEARTBEAT) = range(8)
+VERSION_OFFSET = 64
+VERSION_BYTES = CONTROL_BYTES - VERSION_OFFSET
+
+SLOT_HEADER_BYTES = 32
+
+# The server bumps the heartbeat at least this often while running
+HEARTBEAT_INTERVAL_S = 0.5
+# A ring whose heartbeat hasn't moved for this long is treated as dead
+# (longer than any single forward pass, which runs between beats)
+SHM_STALE_S = float(os.getenv("SHM_STALE_S", "10"))
+# How often a worker without a live ring looks for a restarted server
+SHM_REATTACH_S = 0.25
+
+
+def _align(n, to=64):
+    return (n + to - 1) // to * to
+
+
+class ShmRing:
+    """NumPy views over one worker's shared-memory segment."""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        buf = shm.buf
+
+        self.control = np.ndarray((8,), dtype=np.int64, buffer=buf)
+        self.slots = int(self.control[CTRL_SLOTS])
+        self.max_batch = int(self.control[CTRL_MAX_BATCH])
+        height = int(self.control[CTRL_HEIGHT])
+        width = int(self.control[CTRL_WIDTH])
+        self.output_width = int(self.control[CTRL_OUTPUT_WIDTH])
+
+        self.input_shape = (self.max_batch, height, width, 3)
+        input_bytes = int(np.prod(self.input_shape))
+        output_bytes = self.max_batch * self.output_width * 4
+        self.slot_bytes = _align(SLOT_HEADER_BYTES + input_bytes + output_bytes)
+
+        # Strided views so the server can scan every slot state in one NumPy op
+        self.states = np.ndarray((self.slots,), dtype=np.int64, buffer=buf,
+                                 offset=CONTROL_BYTES, strides=(self.slot_bytes,))
+        self.seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=buf,
+                               offset=CONTROL_BYTES + 8, strides=(self.slot_bytes,))
+        self.counts = np.ndarray((self.slots,), dtype=np.int64, buffer=buf,
+                                 offset=CONTROL_BYTES + 16, strides=(self.slot_bytes,))
+
+        self.inputs = []
+        self.outputs = []
+        for i in range(self.slots):
+            base = CONTROL_BYTES + i * self.slot_bytes + SLOT_HEADER_BYTES
+            self.inputs.append(np.ndarray(self.input_shape, dtype=np.uint8, buffer=buf, offset=base))
+            self.outputs.append(np.ndarray((self.max_batch, self.output_width), dtype=np.float32,
+                                           buffer=buf, offset=base + input_bytes))
+
+    @staticmethod
+    def segment_size(slots, max_batch, img_size, output_width):
+        input_bytes = max_batch * img_size[0] * img_size[1] * 3
+        output_bytes = max_batch * output_width * 4
+        return CONTROL_BYTES + slots * _align(SLOT_HEADER_BYTES + input_bytes + output_bytes)
+
+    @classmethod
+    def create(cls, name, slots, max_batch, img_size, output_width=1, generation=None):
+        """Create (or replace a stale) segment. Called by the inference server."""
+        size = cls.segment_size(slots, max_batch, img_size, output_width)
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            pass
+        else:
+            # Workers may still map it after a crash: tell them to re-attach
+            if stale.size >= CONTROL_BYTES:
+                control = np.ndarray((8,), dtype=np.int64, buffer=stale.buf)
+                control[CTRL_READY] = 0
+                del control
+            stale.close()
+            stale.unlink()
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        control = np.ndarray((8,), dtype=np.int64, buffer=shm.buf)
+        control[:] = 0
+        control[CTRL_SLOTS] = slots
+        control[CTRL_MAX_BATCH] = max_batch
+        control[CTRL_HEIGHT], control[CTRL_WIDTH] = img_size
+        control[CTRL_OUTPUT_WIDTH] = output_width
+        control[CTRL_GENERATION] = time.time_ns() if generation is None else generation
+        del control
+        ring = cls(shm, owner=True)
+        ring.states[:] = FREE
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        """Map an existing segment. Called by HTTP workers."""
+        shm = shared_memory.SharedMemory(name=name)
+        # Attaching registers the segment with this process's resource
+        # tracker, which would unlink it when the worker exits.
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def ready(self):
+        return bool(self.control[CTRL_READY])
+
+    def set_ready(self, ready):
+        self.control[CTRL_READY] = int(ready)
+
+    @property
+    def generation(self):
+        """Identifies the server run that created the segment."""
+        return int(self.control[CTRL_GENERATION])
+
+    @property
+    def heartbeat(self):
+        return int(self.control[CTRL_HEARTBEAT])
+
+    def beat(self):
+        self.control[CTRL_HEARTBEAT] += 1
+
+    @property
+    def model_version(self):
+        raw = bytes(self.shm.buf[VERSION_OFFSET:VERSION_OFFSET + VERSION_BYTES])
+        return raw.split(b"\0", 1)[0].decode("utf-8") or None
+
+    def set_model_version(self, version):
+        encoded = version.encode("utf-8")[:VERSION_BYTES - 1]
+        self.shm.buf[VERSION_OFFSET:VERSION_OFFSET + VERSION_BYTES] = encoded.ljust(VERSION_BYTES, b"\0")
+
+    def close(self):
+        # Drop our NumPy views first; SharedMemory refuses to close while exported
+        self.control = self.states = self.seqs = self.counts = None
+        self.inputs = self.outputs = []
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def claim_ring(ring_count, lock_dir):
+    """
+    Pick an unowned ring for this worker process.
+
+    Holds an exclusive flock on the ring's lock file for the life of the
+    process, so each worker gets its own single-producer ring without any
+    coordination with uvicorn. Returns (index, lock_file).
+    """
+    os.makedirs(lock_dir, exist_ok=True)
+    for index in range(ring_count):
+        lock_file = open(os.path.join(lock_dir, RING_NAME.format(index) + ".lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        return index, lock_file
+    raise RuntimeError(f"All {ring_count} shared-memory rings are in use; start the "
+                       f"inference server with --rings >= number of workers")
+
+# ========== Worker Side ==========
+
+class InferenceServerUnavailable(RuntimeError):
+    """The inference server stopped, crashed or restarted under a request."""
+
+
+class _Attachment:
+    """One mapping of this worker's ring plus its slot bookkeeping."""
+
+    def __init__(self, ring, stale_after):
+        self.ring = ring
+        self.generation = ring.generation
+        self.stale_after = stale_after
+        self.free = list(range(ring.slots))
+        self.abandoned = []
+        self.slot_available = asyncio.Semaphore(ring.slots)
+        self.in_flight = 0
+        self.retired = False
+        self._beat = ring.heartbeat
+        self._beat_seen_at = time.monotonic()
+
+    def alive(self):
+        """Ready and the heartbeat moved within `stale_after` seconds."""
+        if not self.ring.ready:
+            return False
+        beat = self.ring.heartbeat
+        now = time.monotonic()
+        if beat != self._beat:
+            self._beat, self._beat_seen_at = beat, now
+            return True
+        return now - self._beat_seen_at < self.stale_after
+
+    def release(self, slot):
+        self.ring.states[slot] = FREE
+        self.free.append(slot)
+        self.slot_available.release()
+
+    def reclaim_abandoned(self):
+        for slot in list(self.abandoned):
+            if self.ring.states[slot] != READY:
+                self.abandoned.remove(slot)
+                self.release(slot)
+
+    def retire(self):
+        """Stop using this mapping; it is unmapped once no request holds a slot."""
+        self.retired = True
+        # Wake anyone queued for a slot so they fail over to the new ring
+        for _ in range(self.ring.slots):
+            self.slot_available.release()
+        self.close_if_idle()
+
+    def close_if_idle(self):
+        if self.retired and self.in_flight == 0 and self.ring.control is not None:
+            self.ring.close()
+
+
+class SharedMemoryClient:
+    """
+    Sends preprocessed batches to the inference server through this
+    worker's ring and awaits the scores.
+
+    If the server stops (ready flag cleared) or hangs/crashes (heartbeat
+    stale), requests fail with InferenceServerUnavailable until it publishes
+    a new generation of the ring, which the client then re-attaches to.
+    on_attach(ring) runs after every attach, e.g. to follow a new max_batch.
+    """
+
+    def __init__(self, ring_count, lock_dir, poll_interval=0.0005, stale_after=SHM_STALE_S, on_attach=None):
+        self.ring_count = ring_count
+        self.lock_dir = lock_dir
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.on_attach = on_attach
+        self.index = None
+        self.name = None
+        self.reconnects = 0
+        self._lock_file = None
+        self._attachment = None
+        self._next_attach = 0.0
+        self._seq = 0
+
+    async def connect(self, timeout=120):
+        """Claim a ring and wait for the inference server to mark it ready."""
+        self.index, self._lock_file = claim_ring(self.ring_count, self.lock_dir)
+        self.name = RING_NAME.format(self.index)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._live_attachment() is None:
+            if loop.time() > deadline:
+                raise TimeoutError(f"Inference server did not publish {self.name} within {timeout}s")
+            await asyncio.sleep(SHM_REATTACH_S)
+        return self
+
+    def _live_attachment(self):
+        """The current attachment if its server is alive, re-attaching to a restarted one."""
+        current = self._attachment
+        if current is not None and current.alive():
+            return current
+        now = time.monotonic()
+        if now < self._next_attach:
+            return None
+        self._next_attach = now + SHM_REATTACH_S
+        try:
+            ring = ShmRing.attach(self.name)
+        except FileNotFoundError:
+            return None
+        if not ring.ready or (current is not None and ring.generation == current.generation):
+            # Not published yet, or the same server run that just stopped beating
+            ring.close()
+            return None
+        if current is not None:
+            current.retire()
+            self.reconnects += 1
+            print(f"🔁 Re-attached to {self.name} (inference server restarted)")
+        self._attachment = _Attachment(ring, self.stale_after)
+        if self.on_attach is not None:
+            self.on_attach(ring)
+        return self._attachment
+
+    @property
+    def ring(self):
+        return self._attachment.ring if self._attachment is not None else None
+
+    @property
+    def ready(self):
+        return self._live_attachment() is not None
+
+    @property
+    def model_version(self):
+        return self.ring.model_version if self.ring is not None else None
+
+    @property
+    def max_batch(self):
+        return self.ring.max_batch
+
+    async def predict(self, img_array, timeout=30):
+        """Score a uint8 NHWC batch; more than `max_batch` images are spread over several slots."""
+        attachment = self._live_attachment()
+        if attachment is None:
+            raise InferenceServerUnavailable("Inference server is not running")
+        ring = attachment.ring
+        count = len(img_array)
+        if count > ring.max_batch:
+            # e.g. queued before a restart brought a smaller --max-batch
+            pieces = [img_array[i:i + ring.max_batch] for i in range(0, count, ring.max_batch)]
+            return np.concatenate(await asyncio.gather(*(self.predict(p, timeout) for p in pieces)))
+
+        attachment.reclaim_abandoned()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Re-check the server now and then while every slot is taken
+            try:
+                await asyncio.wait_for(attachment.slot_available.acquire(), SHM_REATTACH_S)
+                break
+            except asyncio.TimeoutError:
+                if attachment.retired or self._live_attachment() is not attachment:
+                    raise InferenceServerUnavailable("Inference server is not running")
+                if loop.time() > deadline:
+                    raise TimeoutError("No free ring slot: inference server is not answering")
+        if attachment.retired:
+            raise InferenceServerUnavailable("Inference server restarted")
+        if not attachment.alive():
+            # Hand the slot on so the next queued request fails fast too
+            attachment.slot_available.release()
+            raise InferenceServerUnavailable("Inference server is not running")
+        slot = attachment.free.pop()
+        attachment.in_flight += 1
+        try:
+            ring.inputs[slot][:count] = img_array
+            ring.counts[slot] = count
+            self._seq += 1
+            ring.seqs[slot] = self._seq
+            # State is written last: it publishes the slot to the server
+            ring.states[slot] = READY
+
+            deadline = loop.time() + timeout
+            while ring.states[slot] == READY:
+                if attachment.retired or not attachment.alive():
+                    # A stalled server may still answer; recycle the slot if it does
+                    attachment.abandoned.append(slot)
+                    # Re-attach now if a new server is up, failing over queued requests
+                    self._live_attachment()
+                    raise InferenceServerUnavailable("Inference server stopped while scoring")
+                if loop.time() > deadline:
+                    # The server still owns the slot; recycle it once it answers
+                    attachment.abandoned.append(slot)
+                    raise TimeoutError("Inference server did not answer in time")
+                await asyncio.sleep(self.poll_interval)
+
+            try:
+                if ring.states[slot] == ERROR:
+                    raise RuntimeError("Inference server failed to score the batch")
+                return ring.outputs[slot][:count].copy()
+            finally:
+                attachment.release(slot)
+        finally:
+            attachment.in_flight -= 1
+            attachment.close_if_idle()
+
+    def close(self):
+        if self._attachment is not None:
+            self._attachment.retired = True
+            self._attachment.in_flight = 0
+            self._attachment.close_if_idle()
+            self._attachment = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -0,0 +1,36 @@
+"""
+Shared test setup: every test session gets its own SQLite database and
+data directories, configured before any backend module reads them.
+
+    cd backend
+    pip install -r tests/requirements.txt
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="oncodetect-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+for name in ("HEATMAP_DIR", "EMBEDDING_DIR", "ARCHIVE_DIR", "PROFILE_DIR"):
+    os.environ[name] = os.path.join(WORKDIR, name.lower())
+os.environ["ADMIN_TOKEN"] = "test-admin-token"
+os.environ["RETENTION_INTERVAL_S"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """A session on an empty database."""
+    from database import Base, SessionLocal, engine, init_db
+
+    init_db()
+    session = SessionLocal()
+    yield session
+    session.close()
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
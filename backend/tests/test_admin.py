@@ -0,0 +1,43 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+ADMIN_ENDPOINTS = [
+    ("post", "/predictions/archive?days=0"),
+    ("post", "/predictions/index/build"),
+    ("post", "/models/v9/activate"),
+    ("delete", "/models/shadow"),
+    ("post", "/profiling/arm?requests=1"),
+    ("get", "/profiling"),
+]
+
+
+@pytest.fixture
+def client():
+    # No `with`: startup (and model loading) never runs
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("method,path", ADMIN_ENDPOINTS)
+def test_admin_endpoints_closed_without_configured_token(client, monkeypatch, method, path):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert getattr(client, method)(path).status_code == 503
+    assert getattr(client, method)(path, headers={"X-Admin-Token": ""}).status_code == 503
+
+
+@pytest.mark.parametrize("method,path", ADMIN_ENDPOINTS)
+def test_admin_endpoints_reject_wrong_token(client, method, path):
+    assert getattr(client, method)(path).status_code == 403
+    assert getattr(client, method)(path, headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+
+def test_admin_endpoint_accepts_configured_token(client):
+    response = client.get("/profiling", headers={"X-Admin-Token": main.ADMIN_TOKEN})
+    assert response.status_code == 200
+
+
+def test_nobody_is_admin_without_configured_token(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert not main.is_admin(None)
+    assert not main.is_admin("")
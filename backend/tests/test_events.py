@@ -0,0 +1,166 @@
+import asyncio
+import json
+
+from database import PredictionLog
+from events import EventHub
+
+
+def stats(benign=0, malignant=0):
+    total = benign + malignant
+    return {
+        "total_predictions": total,
+        "benign_count": benign,
+        "malignant_count": malignant,
+        "benign_percentage": round(benign / total * 100, 2) if total else 0,
+        "malignant_percentage": round(malignant / total * 100, 2) if total else 0,
+        "live_predictions": total,
+        "archived_predictions": 0,
+    }
+
+
+def prediction(id, label="Benign"):
+    return {"id": id, "prediction": label}
+
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        message = subscription.queue.get_nowait()
+        name, data = message.split("\n")[:2]
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_publish_folds_into_counters():
+    async def run():
+        hub = EventHub()
+        subscription = hub.subscribe()
+        await hub.ensure_seeded(_loader(stats(benign=2), [prediction(2), prediction(1)], 2))
+        hub.publish_prediction(prediction(3, "Malignant"))
+        [(name, data)] = drain(subscription)
+        assert name == "prediction"
+        assert data["stats"]["total_predictions"] == 3
+        assert data["stats"]["malignant_count"] == 1
+        assert [p["id"] for p in hub.snapshot()["predictions"]] == [3, 2, 1]
+
+    asyncio.run(run())
+
+
+def test_predictions_logged_during_seed_are_counted_once():
+    async def run():
+        hub = EventHub()
+        hub.subscribe()
+        reading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def load():
+            # The read covers ids up to 5; 5 and 6 are published while it runs
+            reading.set()
+            await release.wait()
+            return stats(benign=5), [prediction(5)], 5
+
+        seeding = asyncio.create_task(hub.ensure_seeded(load))
+        await reading.wait()
+        hub.publish_prediction(prediction(5))
+        hub.publish_prediction(prediction(6, "Malignant"))
+        release.set()
+        await seeding
+
+        snapshot = hub.snapshot()
+        assert snapshot["stats"]["total_predictions"] == 6
+        assert snapshot["stats"]["malignant_count"] == 1
+        assert [p["id"] for p in snapshot["predictions"]] == [6, 5]
+
+        # A late publish of an already-counted row is ignored
+        hub.publish_prediction(prediction(4))
+        assert hub.snapshot()["stats"]["total_predictions"] == 6
+
+    asyncio.run(run())
+
+
+def test_concurrent_subscribers_seed_once():
+    async def run():
+        hub = EventHub()
+        hub.subscribe()
+        hub.subscribe()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return stats(benign=1), [prediction(1)], 1
+
+        await asyncio.gather(hub.ensure_seeded(load), hub.ensure_seeded(load))
+        assert len(calls) == 1
+
+    asyncio.run(run())
+
+
+def test_resync_pushes_database_state():
+    async def run():
+        hub = EventHub()
+        subscription = hub.subscribe()
+        await hub.ensure_seeded(_loader(stats(benign=1), [prediction(1)], 1))
+        hub.publish_prediction(prediction(2))
+        drain(subscription)
+
+        # Another worker logged 3 and 4 (one Malignant)
+        await hub.resync(_loader(stats(benign=3, malignant=1), [prediction(4), prediction(3)], 4))
+        [(name, data)] = drain(subscription)
+        assert name == "snapshot"
+        assert data["stats"]["total_predictions"] == 4
+        assert data["stats"]["malignant_count"] == 1
+        assert hub.resyncs == 1
+
+        hub.publish_prediction(prediction(5))
+        assert hub.snapshot()["stats"]["total_predictions"] == 5
+
+    asyncio.run(run())
+
+
+def test_resync_without_subscribers_skips_the_database():
+    async def run():
+        hub = EventHub()
+
+        async def load():
+            raise AssertionError("should not read")
+
+        await hub.resync(load)
+        assert not hub.seeded
+
+    asyncio.run(run())
+
+
+def test_last_unsubscribe_clears_state():
+    async def run():
+        hub = EventHub()
+        subscription = hub.subscribe()
+        await hub.ensure_seeded(_loader(stats(), [], 0))
+        hub.unsubscribe(subscription)
+        assert not hub.seeded
+        hub.publish_prediction(prediction(1))
+        assert hub.published == 0
+
+    asyncio.run(run())
+
+
+def test_dashboard_state_is_read_up_to_one_id(db):
+    import main
+
+    for i, label in enumerate(["Benign", "Malignant", "Benign"]):
+        db.add(PredictionLog(input_filename=f"scan_{i}.png", prediction_result=label,
+                             confidence_score=0.9, raw_score=0.1, model_version="v3"))
+    db.commit()
+
+    state_stats, recent, last_id = main.load_dashboard_state()
+    assert last_id == 3
+    assert state_stats["total_predictions"] == 3
+    assert state_stats["malignant_count"] == 1
+    assert {p["id"] for p in recent} == {1, 2, 3}
+    assert main.compute_stats(db, through_id=2)["total_predictions"] == 2
+
+
+def _loader(*state):
+    async def load():
+        return state
+    return load
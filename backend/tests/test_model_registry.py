@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from model_registry import ModelEntry, ModelRegistry
+
+
+def entry(version, scorer):
+    return ModelEntry(version, f"{version}.h5", None, None, scorer)
+
+
+@pytest.fixture
+def registry():
+    registry = ModelRegistry((4, 4), shadow_max_pending=2)
+    registry._models["v1"] = entry("v1", lambda images: np.zeros((len(images), 1)))
+    registry.activate("v1")
+    yield registry
+    registry.shutdown()
+
+
+def test_shadow_queue_is_bounded(registry):
+    release = threading.Event()
+
+    def slow(images):
+        release.wait(5)
+        return np.ones((len(images), 1))
+
+    registry._models["v2"] = entry("v2", slow)
+    registry.set_shadow("v2", 1.0)
+    results = []
+    images = np.zeros((1, 4, 4, 3), dtype=np.uint8)
+
+    futures = [registry.maybe_shadow(images, lambda *args: results.append(args)) for _ in range(5)]
+    assert sum(f is not None for f in futures) == 2
+    assert registry.status()["shadow_dropped"] == 3
+    assert registry.status()["shadow_pending"] == 2
+
+    release.set()
+    for future in filter(None, futures):
+        future.result(timeout=5)
+    assert [r[:2] for r in results] == [("v2", 1.0), ("v2", 1.0)]
+    assert registry.status()["shadow_pending"] == 0
+
+    # Room again once the backlog drained
+    assert registry.maybe_shadow(images, lambda *args: None).result(timeout=5) is None
+
+
+def test_failed_shadow_job_frees_its_place(registry):
+    def broken(images):
+        raise RuntimeError("boom")
+
+    registry._models["v2"] = entry("v2", broken)
+    registry.set_shadow("v2", 1.0)
+    images = np.zeros((1, 4, 4, 3), dtype=np.uint8)
+    for _ in range(4):
+        with pytest.raises(RuntimeError):
+            registry.maybe_shadow(images, lambda *args: None).result(timeout=5)
+    assert registry.status()["shadow_pending"] == 0
+    assert registry.status()["shadow_dropped"] == 0
+
+
+@pytest.mark.parametrize("method,path", [
+    ("post", "/models/v2/load?filename=v2.h5"),
+    ("post", "/models/v2/activate"),
+    ("post", "/models/v2/shadow"),
+    ("delete", "/models/shadow"),
+    ("delete", "/models/v2"),
+])
+def test_hot_swap_refused_in_shared_mode(monkeypatch, method, path):
+    monkeypatch.setattr(main, "SERVING_MODE", "shared")
+    client = TestClient(main.app)
+    response = getattr(client, method)(path, headers={"X-Admin-Token": main.ADMIN_TOKEN})
+    assert response.status_code == 409
+    assert "SERVING_MODE=shared" in response.json()["detail"]
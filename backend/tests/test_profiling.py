@@ -0,0 +1,43 @@
+import threading
+import time
+
+from profiling import NO_TRACE, Profiler, RequestTrace, profile_requested
+
+
+def busy_model_call(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_sees_threadpool_threads():
+    trace = RequestTrace("/predict", "test", sample_interval=0.001)
+    worker = threading.Thread(target=busy_model_call, args=(0.1,), name="AnyIO worker thread")
+    with trace.stage("model"):
+        worker.start()
+        worker.join()
+    result = trace.finish()
+    folded = trace.folded()
+
+    assert result["stages"][0]["stage"] == "model"
+    assert any(line.startswith("AnyIO worker thread;") and "busy_model_call" in line
+               for line in folded.splitlines())
+    assert "profile-sampler" not in folded
+
+
+def test_profiler_rate_limits_header_requests(tmp_path):
+    profiler = Profiler(directory=str(tmp_path), min_interval=60)
+    trace, skipped = profiler.start("/predict", requested=True)
+    assert trace.enabled and skipped is None
+    assert profiler.start("/predict", requested=True) == (NO_TRACE, "busy")
+    profiler.finish(trace)
+    assert profiler.start("/predict", requested=True) == (NO_TRACE, "rate-limited")
+    assert [p["id"] for p in profiler.list()] == [trace.id]
+    assert profiler.path_for("../etc", ".json") is None
+
+
+def test_profile_header_values():
+    for value in ("1", "true", "TRUE", " yes "):
+        assert profile_requested(value)
+    for value in (None, "", "0", "false", "no", "off"):
+        assert not profile_requested(value)
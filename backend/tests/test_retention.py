@@ -0,0 +1,133 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import analytics
+import retention
+from database import PredictionLog, PredictionRollup, ShadowPredictionLog
+from vector_index import VectorIndex, index_directory
+
+DAY = date(2024, 1, 15)
+
+
+def add_predictions(db, count, day=DAY):
+    for i in range(count):
+        row = PredictionLog(
+            timestamp=datetime.combine(day, datetime.min.time()) + timedelta(minutes=i),
+            input_filename=f"scan_{i}.png",
+            prediction_result="Malignant" if i % 2 else "Benign",
+            confidence_score=0.8,
+            raw_score=0.1 * (i % 10),
+            model_version="v3",
+        )
+        db.add(row)
+        db.flush()
+        db.add(ShadowPredictionLog(prediction_id=row.id, model_version="v4", raw_score=0.5, latency_ms=3.0))
+    db.commit()
+
+
+def archived_rows(archive_dir, table="predictions"):
+    archived = analytics.load(table, archive_dir=str(archive_dir))
+    return 0 if archived is None else archived.num_rows
+
+
+def test_archive_day_moves_rows_to_parquet_and_rollups(db, tmp_path):
+    add_predictions(db, 10)
+
+    assert retention.archive_day(db, DAY, str(tmp_path), batch_size=4) == 10
+
+    assert db.query(PredictionLog).count() == 0
+    assert db.query(ShadowPredictionLog).count() == 0
+    assert sum(r.count for r in db.query(PredictionRollup)) == 10
+    assert archived_rows(tmp_path) == 10
+    assert archived_rows(tmp_path, "shadow_predictions") == 10
+
+
+def test_rerun_after_crash_does_not_double_count(db, tmp_path, monkeypatch):
+    add_predictions(db, 10)
+    roll_up = retention._roll_up
+    calls = []
+
+    def crash_on_second_batch(session, rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise RuntimeError("simulated crash")
+        roll_up(session, rows)
+
+    monkeypatch.setattr(retention, "_roll_up", crash_on_second_batch)
+    with pytest.raises(RuntimeError):
+        retention.archive_day(db, DAY, str(tmp_path), batch_size=4)
+    db.rollback()
+    assert db.query(PredictionLog).count() == 6
+
+    monkeypatch.setattr(retention, "_roll_up", roll_up)
+    retention.archive_day(db, DAY, str(tmp_path), batch_size=4)
+
+    assert db.query(PredictionLog).count() == 0
+    assert sum(r.count for r in db.query(PredictionRollup)) == 10
+    assert archived_rows(tmp_path) == 10
+    assert archived_rows(tmp_path, "shadow_predictions") == 10
+    assert sum(row["count"] for row in analytics.daily_summary(archive_dir=str(tmp_path))) == 10
+
+
+def test_run_retention_keeps_recent_days(db, tmp_path):
+    add_predictions(db, 3, day=DAY)
+    add_predictions(db, 2, day=DAY + timedelta(days=100))
+
+    summary = retention.run_retention(retention_days=90, archive_dir=str(tmp_path),
+                                      now=datetime.combine(DAY + timedelta(days=100), datetime.min.time()))
+
+    assert summary["rows"] == 3
+    assert db.query(PredictionLog).count() == 2
+
+
+@pytest.fixture
+def similar_cases(db, tmp_path, monkeypatch):
+    """Ten old and five recent predictions, all with near-identical embeddings."""
+    import main
+
+    embedding_dir = str(tmp_path / "embeddings")
+    monkeypatch.setattr(main, "EMBEDDING_DIR", embedding_dir)
+    monkeypatch.setattr(main, "EMBEDDING_INDEXES", {})
+    add_predictions(db, 10, day=DAY)
+    add_predictions(db, 5, day=DAY + timedelta(days=100))
+    index = VectorIndex(index_directory("v3", embedding_dir))
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=16)
+    for row in db.query(PredictionLog).order_by(PredictionLog.id):
+        # Old rows sit closest to the query, so they would win every top-k
+        offset = 0.01 if row.timestamp.date() == DAY else 0.1
+        index.add(row.id, base + offset * rng.normal(size=16))
+    return main, embedding_dir
+
+
+def run_old_day(tmp_path, embedding_dir):
+    return retention.run_retention(retention_days=90, archive_dir=str(tmp_path / "archive"),
+                                   now=datetime.combine(DAY + timedelta(days=100), datetime.min.time()),
+                                   embedding_dir=embedding_dir)
+
+
+def test_similar_search_after_retention_returns_live_rows(db, tmp_path, similar_cases):
+    main, embedding_dir = similar_cases
+    assert run_old_day(tmp_path, embedding_dir)["rows"] == 10
+    query_id = db.query(PredictionLog.id).order_by(PredictionLog.id.desc()).first()[0]
+
+    for exact in (True, False):
+        result = main.get_similar_predictions(query_id, k=3, exact=exact, nprobe=16, db=db)
+        assert len(result["similar"]) == 3
+        assert all(item["timestamp"].startswith(str(DAY + timedelta(days=100))) for item in result["similar"])
+    assert VectorIndex(index_directory("v3", embedding_dir)).stats()["removed"] == 10
+
+
+def test_similar_search_heals_index_archived_without_tombstones(db, tmp_path, similar_cases):
+    main, embedding_dir = similar_cases
+    # An archive run that didn't know about the index (as before tombstones existed)
+    run_old_day(tmp_path, str(tmp_path / "elsewhere"))
+    query_id = db.query(PredictionLog.id).order_by(PredictionLog.id.desc()).first()[0]
+
+    result = main.get_similar_predictions(query_id, k=3, exact=True, nprobe=16, db=db)
+    assert len(result["similar"]) == result["count"] == 3
+    assert VectorIndex(index_directory("v3", embedding_dir)).stats()["removed"] > 0
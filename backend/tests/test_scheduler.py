@@ -0,0 +1,264 @@
+import asyncio
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import scheduler
+from scheduler import BATCH, INTERACTIVE, FairQueue, InferenceScheduler, SchedulerRejected, _Request
+
+
+def images(count, value=0):
+    return np.full((count, 2, 2, 3), value, dtype=np.uint8)
+
+
+def request(key, cost=1, priority=INTERACTIVE):
+    return _Request(images(cost), key, priority, deadline=1e9, enqueued_at=0.0, future=None)
+
+
+class RecordingModel:
+    """Async stand-in model: records the first pixel of each image it scores."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.gate = None
+
+    async def __call__(self, batch):
+        if self.gate is not None:
+            await self.gate.wait()
+        await asyncio.sleep(self.delay)
+        self.batches.append([int(v) for v in batch[:, 0, 0, 0]])
+        return batch[:, 0, 0, :1].astype(np.float32), "v-test"
+
+
+async def run_with_scheduler(sched, body):
+    dispatcher = asyncio.create_task(sched.run())
+    try:
+        return await body()
+    finally:
+        dispatcher.cancel()
+
+
+# ========== Fair queue ==========
+
+def test_fair_queue_round_robins_between_keys():
+    queue = FairQueue(quantum=2)
+    for _ in range(6):
+        queue.push(request("bulk"))
+    queue.push(request("small"))
+    queue.push(request("small"))
+
+    order = [queue.pop().key for _ in range(8)]
+
+    assert order[:4] == ["bulk", "bulk", "small", "small"]
+    assert queue.pop() is None and len(queue) == 0
+
+
+def test_fair_queue_charges_by_image_count():
+    queue = FairQueue(quantum=4)
+    queue.push(request("tta", cost=10))
+    for _ in range(3):
+        queue.push(request("single"))
+
+    # The 10-image request waits until its key has saved up enough deficit
+    assert [queue.pop().key for _ in range(4)] == ["single", "single", "single", "tta"]
+
+
+def test_push_front_restores_head_of_queue():
+    queue = FairQueue(quantum=2)
+    first, second = request("a"), request("a")
+    queue.push(first)
+    queue.push(second)
+    popped = queue.pop()
+    queue.push_front(popped)
+    assert queue.pop() is first and queue.pop() is second
+
+
+# ========== Scheduler ==========
+
+def test_outputs_are_split_back_per_request():
+    model = RecordingModel()
+    sched = InferenceScheduler(model, max_batch=16)
+
+    async def body():
+        model.gate = asyncio.Event()
+        calls = [sched.submit(images(n, value=n), INTERACTIVE, f"k{n}") for n in (1, 3, 2)]
+        tasks = [asyncio.create_task(c) for c in calls]
+        await asyncio.sleep(0.01)
+        model.gate.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(run_with_scheduler(sched, body))
+    for n, (outputs, version) in zip((1, 3, 2), results):
+        assert version == "v-test"
+        assert outputs.shape == (n, 1) and (outputs == n).all()
+
+
+def test_interactive_dispatches_before_queued_batch_work():
+    model = RecordingModel()
+    sched = InferenceScheduler(model, max_batch=1)
+
+    async def body():
+        model.gate = asyncio.Event()
+        tasks = [asyncio.create_task(sched.submit(images(1, value=1), BATCH, "bulk")) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(sched.submit(images(1, value=2), INTERACTIVE, "frontend")))
+        await asyncio.sleep(0.01)
+        model.gate.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run_with_scheduler(sched, body))
+    # The first batch request was already dispatched; the interactive one jumps the rest
+    assert model.batches[:2] == [[1], [2]]
+
+
+def test_interactive_runs_between_pieces_of_an_oversize_batch():
+    model = RecordingModel()
+    sched = InferenceScheduler(model, max_batch=2)
+
+    async def body():
+        model.gate = asyncio.Event()
+        # A screening chunk of 6 tiles is queued as three 2-image pieces
+        screen = asyncio.create_task(sched.submit(images(6, value=1), BATCH, "screen"))
+        await asyncio.sleep(0.01)
+        upload = asyncio.create_task(sched.submit(images(1, value=2), INTERACTIVE, "frontend"))
+        await asyncio.sleep(0.01)
+        model.gate.set()
+        return await screen, await upload
+
+    (outputs, _), _ = asyncio.run(run_with_scheduler(sched, body))
+    assert model.batches == [[1, 1], [2], [1, 1], [1, 1]]
+    assert outputs.shape == (6, 1)
+    assert sched.counters[BATCH]["admitted"] == sched.counters[BATCH]["completed"] == 1
+
+
+def test_oversize_request_keeps_image_order():
+    model = RecordingModel()
+    sched = InferenceScheduler(model, max_batch=4)
+
+    async def body():
+        batch = np.arange(10, dtype=np.uint8).reshape(10, 1, 1, 1).repeat(2, 1).repeat(2, 2).repeat(3, 3)
+        return await sched.submit(batch, BATCH, "screen")
+
+    outputs, version = asyncio.run(run_with_scheduler(sched, body))
+    assert outputs[:, 0].tolist() == list(range(10))
+    assert version == "v-test"
+    assert [len(b) for b in model.batches] == [4, 4, 2]
+
+
+def test_batch_is_not_starved(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_BATCH_EVERY", 2)
+    model = RecordingModel()
+    sched = InferenceScheduler(model, max_batch=1)
+
+    async def body():
+        model.gate = asyncio.Event()
+        tasks = [asyncio.create_task(sched.submit(images(1, value=2), INTERACTIVE, "frontend"))
+                 for _ in range(6)]
+        tasks.append(asyncio.create_task(sched.submit(images(1, value=1), BATCH, "bulk")))
+        await asyncio.sleep(0.01)
+        model.gate.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run_with_scheduler(sched, body))
+    assert [1] in model.batches[:4]
+
+
+def test_rejects_unmeetable_deadline_up_front():
+    sched = InferenceScheduler(RecordingModel(), max_batch=4)
+    sched.seconds_per_image = 0.05
+    for _ in range(10):
+        sched.queues[INTERACTIVE].push(request("other"))
+
+    async def body():
+        with pytest.raises(SchedulerRejected) as rejected:
+            await sched.submit(images(1), INTERACTIVE, "k", deadline_ms=100)
+        return rejected.value
+
+    rejected = asyncio.run(body())
+    assert rejected.reason == "deadline_unmeetable"
+    assert rejected.retry_after >= 1
+    assert sched.counters[INTERACTIVE]["shed"]["deadline_unmeetable"] == 1
+
+
+def test_expired_request_is_shed_and_never_scored():
+    model = RecordingModel()
+    sched = InferenceScheduler(model, max_batch=1)
+
+    async def body():
+        model.gate = asyncio.Event()
+        first = asyncio.create_task(sched.submit(images(1, value=1), INTERACTIVE, "a"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerRejected) as rejected:
+            await sched.submit(images(1, value=2), INTERACTIVE, "b", deadline_ms=30)
+        model.gate.set()
+        await first
+        await asyncio.sleep(0.01)
+        return rejected.value
+
+    rejected = asyncio.run(run_with_scheduler(sched, body))
+    assert rejected.reason == "deadline_expired"
+    assert model.batches == [[1]]
+
+
+def test_queue_full(monkeypatch):
+    monkeypatch.setitem(scheduler.MAX_QUEUE, BATCH, 2)
+    sched = InferenceScheduler(RecordingModel())
+    for _ in range(2):
+        sched.queues[BATCH].push(request("bulk", priority=BATCH))
+
+    async def body():
+        with pytest.raises(SchedulerRejected) as rejected:
+            await sched.submit(images(1), BATCH, "bulk")
+        return rejected.value
+
+    assert asyncio.run(body()).reason == "queue_full"
+
+
+# ========== API mapping ==========
+
+def test_rejection_becomes_503_with_retry_after(monkeypatch):
+    import main
+
+    async def shed(*args, **kwargs):
+        raise SchedulerRejected("queue_full", retry_after=7)
+
+    monkeypatch.setattr(main.SCHEDULER, "submit", shed)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.schedule(images(1), INTERACTIVE, "k"))
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "7"
+
+
+@pytest.mark.parametrize("x_priority,x_api_key,origin,expected", [
+    (None, None, "https://oncodetect-frontend.onrender.com", (INTERACTIVE, "frontend")),
+    ("batch", None, "https://oncodetect-frontend.onrender.com", (BATCH, "frontend")),
+    # Allowed by CORS but not an interactive origin unless configured
+    (None, None, "http://localhost:3000", (BATCH, "anonymous")),
+    (None, None, None, (BATCH, "anonymous")),
+    ("interactive", None, None, (BATCH, "anonymous")),
+    ("interactive", "bulk-export", None, (BATCH, "bulk-export")),
+    (None, "pacs-viewer", None, (INTERACTIVE, "pacs-viewer")),
+    ("batch", "pacs-viewer", None, (BATCH, "pacs-viewer")),
+])
+def test_priority_can_only_be_lowered(monkeypatch, x_priority, x_api_key, origin, expected):
+    import main
+
+    monkeypatch.setattr(main, "INTERACTIVE_API_KEYS", {"pacs-viewer"})
+    assert main.request_priority(x_priority, x_api_key, origin) == expected
+
+
+def test_scheduler_follows_ring_max_batch(monkeypatch):
+    import main
+
+    class Ring:
+        def __init__(self, max_batch):
+            self.max_batch = max_batch
+
+    monkeypatch.setattr(main.SCHEDULER, "max_batch", main.SCHEDULER_MAX_BATCH)
+    main.fit_scheduler_to_ring(Ring(4))
+    assert main.SCHEDULER.max_batch == 4
+    # A restart with a larger --max-batch lifts the cap again, up to the scheduler's own
+    main.fit_scheduler_to_ring(Ring(64))
+    assert main.SCHEDULER.max_batch == main.SCHEDULER_MAX_BATCH
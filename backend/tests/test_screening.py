@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+import screening
+
+IMG_SIZE = (224, 224)
+
+
+def synthetic_slice(size=256, seed=0):
+    rng = np.random.default_rng(seed)
+    hu = np.full((size, size), -1000, dtype=np.float32)
+    y, x = np.ogrid[:size, :size]
+    hu[(x - size / 2) ** 2 + (y - size / 2) ** 2 < (size / 2.5) ** 2] = 40
+    hu += rng.normal(0, 20, hu.shape).astype(np.float32)
+    return hu, hu.astype(np.int16)
+
+
+def per_tile_batch(screen, chunk):
+    rows, cols = screen.kept[chunk].T
+    tiles = [cv2.resize(screen.tiles[r, c], IMG_SIZE[::-1], interpolation=cv2.INTER_LINEAR)
+             for r, c in zip(rows, cols)]
+    return np.repeat(np.stack(tiles)[..., None], 3, axis=-1)
+
+
+@pytest.mark.parametrize("stride", [16, 9, 13])
+def test_build_batch_matches_per_tile_resize(stride):
+    screen = screening.SliceScreen(*synthetic_slice(), stride=stride)
+    chunk = next(screen.chunks(32))
+    batch = screen.build_batch(chunk, IMG_SIZE)
+
+    assert batch.shape == (len(chunk),) + IMG_SIZE + (3,)
+    expected = per_tile_batch(screen, chunk)
+    # The upscale-once path differs from per-tile resizing only at the border
+    inner = (slice(None), slice(4, -4), slice(4, -4))
+    assert np.abs(batch[inner].astype(int) - expected[inner]).max() <= 1
+
+
+def test_odd_stride_never_builds_a_full_resized_grid():
+    screen = screening.SliceScreen(*synthetic_slice(), stride=9)
+    for chunk in screen.chunks(64):
+        screen.build_batch(chunk, IMG_SIZE)
+    assert screen._resized is None
+
+
+def test_release_drops_upscaled_slice():
+    screen = screening.SliceScreen(*synthetic_slice(), stride=16)
+    screen.build_batch(next(screen.chunks(8)), IMG_SIZE)
+    assert screen._resized is not None
+    screen.release()
+    assert screen._resized is None
+
+
+def test_screen_slices_reports_detections():
+    hu, raw = synthetic_slice()
+    results, stats = screening.screen_slices(
+        [(hu, raw, {"z": 0.0})], lambda batch: np.full((len(batch), 1), 0.9), IMG_SIZE,
+        batch_size=64, stride=32, threshold=0.5,
+    )
+    assert stats["tiles_scored"] == results[0]["tiles_scored"] > 0
+    assert results[0]["screen"]._resized is None
+    boxes = [d["box"] for d in results[0]["detections"]]
+    assert boxes and all(x1 - x0 == screening.WINDOW for x0, _, x1, _ in boxes)
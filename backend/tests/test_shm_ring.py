@@ -0,0 +1,174 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from shm_ring import DONE, READY, RING_NAME, InferenceServerUnavailable, SharedMemoryClient, ShmRing
+
+IMG_SIZE = (4, 4)
+
+
+class FakeServer:
+    """Stands in for inference_server.serve: scores READY slots and beats."""
+
+    def __init__(self, generation, slots=2, max_batch=2):
+        self.ring = ShmRing.create(RING_NAME.format(0), slots, max_batch, IMG_SIZE, 1, generation)
+        self.ring.set_model_version(f"gen{generation}")
+        self.ring.set_ready(True)
+        self.paused = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        ring = self.ring
+        while True:
+            if not self.paused:
+                ring.beat()
+                for slot in np.flatnonzero(ring.states == READY):
+                    count = int(ring.counts[slot])
+                    ring.outputs[slot][:count, 0] = ring.inputs[slot][:count].reshape(count, -1).sum(axis=1)
+                    ring.states[slot] = DONE
+            await asyncio.sleep(0.001)
+
+    def crash(self):
+        """Stop beating and answering, leaving the segment in place."""
+        self._task.cancel()
+
+    def stop(self):
+        self._task.cancel()
+        self.ring.set_ready(False)
+        self.ring.close()
+
+
+def batch(value, count=1):
+    return np.full((count, *IMG_SIZE, 3), value, dtype=np.uint8)
+
+
+def run(scenario):
+    async def wrapper():
+        servers = []
+        try:
+            await scenario(servers)
+        finally:
+            for server in servers:
+                server.stop()
+    asyncio.run(wrapper())
+
+
+def test_round_trip(tmp_path):
+    async def scenario(servers):
+        servers.append(FakeServer(generation=1))
+        client = await SharedMemoryClient(1, str(tmp_path)).connect(timeout=5)
+        try:
+            scores = await client.predict(batch(2, count=2))
+            assert scores[:, 0].tolist() == [96.0, 96.0]
+            assert client.model_version == "gen1"
+        finally:
+            client.close()
+
+    run(scenario)
+
+
+def test_reattaches_after_server_restart(tmp_path):
+    async def scenario(servers):
+        servers.append(FakeServer(generation=1))
+        client = await SharedMemoryClient(1, str(tmp_path)).connect(timeout=5)
+        try:
+            await client.predict(batch(1))
+            # A new run replaces the segment and flags the old mapping not ready
+            servers[0].crash()
+            servers.append(FakeServer(generation=2))
+            await asyncio.sleep(0.3)
+
+            scores = await client.predict(batch(1))
+            assert scores[0, 0] == 48.0
+            assert client.model_version == "gen2"
+            assert client.reconnects == 1
+        finally:
+            client.close()
+
+    run(scenario)
+
+
+def test_stale_heartbeat_fails_fast_and_recovers(tmp_path):
+    async def scenario(servers):
+        server = FakeServer(generation=1)
+        servers.append(server)
+        client = await SharedMemoryClient(1, str(tmp_path), stale_after=0.1).connect(timeout=5)
+        try:
+            server.paused = True
+            await asyncio.sleep(0.2)
+            assert not client.ready
+            with pytest.raises(InferenceServerUnavailable):
+                await client.predict(batch(1), timeout=5)
+
+            # Same run resumes: no re-attach needed, and the abandoned slot is recycled
+            server.paused = False
+            await asyncio.sleep(0.05)
+            assert client.ready
+            for _ in range(4):
+                await client.predict(batch(1))
+            assert client.reconnects == 0
+        finally:
+            client.close()
+
+    run(scenario)
+
+
+def test_in_flight_request_fails_when_server_dies(tmp_path):
+    async def scenario(servers):
+        server = FakeServer(generation=1)
+        servers.append(server)
+        client = await SharedMemoryClient(1, str(tmp_path), stale_after=0.2).connect(timeout=5)
+        try:
+            server.paused = True
+            pending = asyncio.create_task(client.predict(batch(1), timeout=5))
+            await asyncio.sleep(0.05)
+            server.crash()
+            with pytest.raises(InferenceServerUnavailable):
+                await asyncio.wait_for(pending, 2)
+        finally:
+            client.close()
+
+    run(scenario)
+
+
+def test_waiting_for_a_slot_fails_over_on_restart(tmp_path):
+    async def scenario(servers):
+        server = FakeServer(generation=1, slots=1)
+        servers.append(server)
+        client = await SharedMemoryClient(1, str(tmp_path)).connect(timeout=5)
+        try:
+            server.paused = True
+            first = asyncio.create_task(client.predict(batch(1), timeout=5))
+            second = asyncio.create_task(client.predict(batch(1), timeout=5))
+            await asyncio.sleep(0.05)
+            server.crash()
+            servers.append(FakeServer(generation=2, slots=1))
+            # The in-flight request notices, re-attaches and wakes the queued one
+            results = await asyncio.wait_for(asyncio.gather(first, second, return_exceptions=True), 2)
+            assert all(isinstance(r, InferenceServerUnavailable) for r in results)
+            assert (await client.predict(batch(1)))[0, 0] == 48.0
+        finally:
+            client.close()
+
+    run(scenario)
+
+
+def test_tta_sized_batch_after_restart_with_smaller_max_batch(tmp_path):
+    async def scenario(servers):
+        seen = []
+        servers.append(FakeServer(generation=1, max_batch=16))
+        client = await SharedMemoryClient(1, str(tmp_path), on_attach=lambda ring: seen.append(ring.max_batch)).connect(timeout=5)
+        try:
+            servers[0].crash()
+            servers.append(FakeServer(generation=2, max_batch=4))
+            await asyncio.sleep(0.3)
+
+            # Ten TTA views no longer fit one slot: they are spread over three
+            scores = await client.predict(batch(1, count=10))
+            assert scores[:, 0].tolist() == [48.0] * 10
+            assert seen == [16, 4]
+        finally:
+            client.close()
+
+    run(scenario)
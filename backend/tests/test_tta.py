@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from tta import TTA_VIEWS, make_tta_batch, summarize_scores
+
+
+def image(size=32):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, size=(1, size, size, 3), dtype=np.uint8)
+
+
+def test_views_are_the_expected_transforms():
+    img = image()
+    batch = make_tta_batch(img, shift=4)
+    base = img[0]
+    assert batch.shape == (len(TTA_VIEWS),) + base.shape
+    assert (batch[0] == base).all()
+    assert (batch[1] == base[:, ::-1]).all()
+    assert (batch[2] == base[::-1]).all()
+    assert (batch[3] == np.rot90(base)).all()
+    # shift_down: rows move down, the top edge is replicated
+    shifted = batch[TTA_VIEWS.index("shift_down")]
+    assert (shifted[4:] == base[:-4]).all() and (shifted[:4] == base[:1]).all()
+
+
+def test_first_n_views():
+    assert make_tta_batch(image(), 3).shape[0] == 3
+
+
+@pytest.mark.parametrize("views", [0, -1, len(TTA_VIEWS) + 1])
+def test_invalid_view_counts_are_rejected(views):
+    with pytest.raises(ValueError):
+        make_tta_batch(image(), views)
+
+
+def test_summarize_scores():
+    summary = summarize_scores([0.2, 0.4, 0.6])
+    assert summary["views"] == 3
+    assert summary["mean_score"] == pytest.approx(0.4)
+    assert summary["min_score"] == pytest.approx(0.2) and summary["max_score"] == pytest.approx(0.6)
+
+
+@pytest.mark.parametrize("views", [-1, 0, len(TTA_VIEWS) + 1])
+def test_predict_validates_tta_views_before_reading_the_upload(views):
+    import main
+
+    response = TestClient(main.app).post(
+        f"/predict?tta=true&tta_views={views}", files={"file": ("a.png", b"\x89PNG\r\n\x1a\n", "image/png")}
+    )
+    assert response.status_code == 422
@@ -0,0 +1,130 @@
+import io
+import struct
+
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+import main
+from uploads import (
+    MAX_UPLOAD_BYTES,
+    UploadLimitMiddleware,
+    _too_large_detail,
+    inspect_dicom_upload,
+    inspect_upload,
+    sniff_image_header,
+)
+
+
+def png_header(width, height):
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height) + b"\x08\x02\x00\x00\x00"
+
+
+def jpeg_header(width, height):
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    sof = b"\xff\xc0" + struct.pack(">HBHH", 11, 8, height, width) + b"\x01\x11\x00"
+    return b"\xff\xd8" + app0 + sof
+
+
+def upload(data):
+    return UploadFile(file=io.BytesIO(data), filename="x")
+
+
+@pytest.fixture
+def limited_client():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def receive(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, limits={"/upload": 1000})
+    return TestClient(app)
+
+
+# ========== Sniffing ==========
+
+def test_sniff_reads_dimensions_from_headers():
+    assert sniff_image_header(png_header(640, 480)) == ("PNG", 640, 480)
+    assert sniff_image_header(jpeg_header(512, 256)) == ("JPEG", 512, 256)
+    assert sniff_image_header(b"GIF89a" + struct.pack("<HH", 32, 16)) == ("GIF", 32, 16)
+    assert sniff_image_header(b"II*\x00" + b"\x00" * 8) == ("TIFF", None, None)
+
+
+def test_sniff_rejects_unknown_bytes():
+    assert sniff_image_header(b"%PDF-1.7 not an image") is None
+    with pytest.raises(HTTPException) as error:
+        inspect_upload(upload(b"%PDF-1.7 not an image"))
+    assert error.value.status_code == 415
+
+
+def test_inspect_upload_checks_size_and_pixels():
+    data = png_header(64, 64) + b"\x00" * 100
+    assert inspect_upload(upload(data)) == ("PNG", len(data))
+
+    with pytest.raises(HTTPException) as error:
+        inspect_upload(upload(b""))
+    assert error.value.status_code == 400
+
+    with pytest.raises(HTTPException) as error:
+        inspect_upload(upload(data), max_bytes=50)
+    assert error.value.status_code == 413
+
+    with pytest.raises(HTTPException) as error:
+        inspect_upload(upload(png_header(5000, 5000)), max_pixels=4096 * 4096)
+    assert error.value.status_code == 413
+    assert "5000x5000" in error.value.detail
+
+
+def test_inspect_dicom_upload_needs_magic():
+    assert inspect_dicom_upload(upload(b"\x00" * 128 + b"DICM" + b"\x00" * 10)) == 142
+    with pytest.raises(HTTPException) as error:
+        inspect_dicom_upload(upload(b"\x00" * 200))
+    assert error.value.status_code == 415
+
+
+def test_too_large_detail_keeps_small_limits_readable():
+    assert _too_large_detail(10 * 1024 * 1024) == "Upload exceeds 10 MB limit"
+    assert _too_large_detail(1536 * 1024) == "Upload exceeds 1.5 MB limit"
+    assert _too_large_detail(500 * 1024) == "Upload exceeds 500 KB limit"
+    assert _too_large_detail(100) == "Upload exceeds 100 bytes limit"
+
+# ========== Body Limit ==========
+
+def test_body_under_limit_passes(limited_client):
+    response = limited_client.post("/upload", files={"file": ("x", b"a" * 100)})
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_declared_length_over_limit_is_refused(limited_client):
+    response = limited_client.post("/upload", files={"file": ("x", b"a" * 2000)})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Upload exceeds 1000 bytes limit"}
+
+
+def test_streamed_body_over_limit_is_cut_off(limited_client):
+    # A generator body is sent chunked, with no Content-Length to check up front
+    def chunks():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"x\"\r\n\r\n"
+        for _ in range(10):
+            yield b"a" * 500
+        yield b"\r\n--b--\r\n"
+
+    response = limited_client.post(
+        "/upload", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"}
+    )
+    assert response.status_code == 413
+
+
+def test_oversized_predict_gets_cors_headers():
+    # No `with`: startup never runs, the middleware answers before the route
+    client = TestClient(main.app)
+    origin = main.FRONTEND_ORIGINS[0]
+    response = client.post(
+        "/predict",
+        files={"file": ("big.png", b"\x00" * (MAX_UPLOAD_BYTES + 1))},
+        headers={"Origin": origin},
+    )
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == origin
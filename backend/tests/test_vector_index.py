@@ -0,0 +1,134 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import VectorIndex
+
+DIM = 32
+
+
+def clustered(count, seed=0, clusters=20):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    return centers[rng.integers(clusters, size=count)] + 0.05 * rng.normal(size=(count, DIM))
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = VectorIndex(str(tmp_path / "v3"))
+    for item_id, vector in enumerate(clustered(600), start=1):
+        index.add(item_id, vector)
+    return index
+
+
+def test_exact_search_finds_nearest_and_excludes_query(index):
+    query = index.vector(42)
+    results = index.search(query, k=5, exclude_id=42, exact=True)
+    assert len(results) == 5
+    assert 42 not in [item_id for item_id, _ in results]
+    assert results == sorted(results, key=lambda r: -r[1])
+
+
+def test_vector_lookup_and_reopen(index):
+    reopened = VectorIndex(index.directory)
+    assert reopened.count == 600
+    np.testing.assert_allclose(reopened.vector(7), index.vector(7))
+    assert reopened.vector(10_000) is None
+
+
+def test_ivf_search_agrees_with_exact(index):
+    index.build_ivf(nlist=16, m=8)
+    for item_id in range(1, 600, 30):
+        query = index.vector(item_id)
+        exact = index.search(query, k=1, exclude_id=item_id, exact=True)
+        approx = index.search(query, k=1, exclude_id=item_id, nprobe=4)
+        # Clusters are tight, so compare similarities rather than ids of near-ties
+        assert approx[0][1] == pytest.approx(exact[0][1], abs=0.01)
+
+
+def test_add_is_not_blocked_while_ivf_trains(index, monkeypatch):
+    training = threading.Event()
+    release = threading.Event()
+    kmeans = vector_index._kmeans
+
+    def slow_kmeans(*args, **kwargs):
+        training.set()
+        assert release.wait(10)
+        return kmeans(*args, **kwargs)
+
+    monkeypatch.setattr(vector_index, "_kmeans", slow_kmeans)
+    builder = threading.Thread(target=index.build_ivf, kwargs={"nlist": 16, "m": 8})
+    builder.start()
+    assert training.wait(10)
+
+    # Appends go through while the build is still training
+    new_vectors = clustered(5, seed=1)
+    adder = threading.Thread(target=lambda: [index.add(1000 + i, v) for i, v in enumerate(new_vectors)])
+    adder.start()
+    adder.join(5)
+    assert not adder.is_alive()
+    with pytest.raises(RuntimeError):
+        VectorIndex(index.directory).build_ivf(nlist=16, m=8)
+
+    release.set()
+    builder.join(30)
+    assert index.ivf is not None and index.ivf.built_count == 600
+    # Rows appended during training were encoded into the new generation
+    assert index.search(new_vectors[3], k=1, nprobe=16)[0][0] == 1003
+
+
+def test_rebuild_replaces_previous_generation(index):
+    index.build_ivf(nlist=16, m=8)
+    first = index.ivf
+    index.build_ivf(nlist=8, m=8)
+    assert index.ivf.generation == first.generation + 1
+    assert not os.path.exists(first.path("pq_codes.u8"))
+    assert VectorIndex(index.directory).ivf.nlist == 8
+
+
+def test_removed_rows_are_masked_from_every_search(index):
+    query = index.vector(42)
+    nearest = [item_id for item_id, _ in index.search(query, k=5, exclude_id=42, exact=True)]
+    assert index.remove(nearest[:3] + [10_000]) == 3
+    assert index.remove(nearest[:3]) == 0
+
+    exact = [item_id for item_id, _ in index.search(query, k=5, exclude_id=42, exact=True)]
+    assert len(exact) == 5 and not set(exact) & set(nearest[:3])
+
+    index.build_ivf(nlist=16, m=8)
+    approx = [item_id for item_id, _ in index.search(query, k=5, exclude_id=42, nprobe=16)]
+    assert not set(approx) & set(nearest[:3])
+
+    # Other processes see the tombstones through the shared files
+    reopened = VectorIndex(index.directory)
+    assert reopened.stats()["removed"] == 3
+    assert not set(i for i, _ in reopened.search(query, k=5, exact=True)) & set(nearest[:3])
+
+
+def test_search_returns_only_live_rows_when_few_are_left(tmp_path):
+    index = VectorIndex(str(tmp_path / "small"))
+    for item_id, vector in enumerate(clustered(4), start=1):
+        index.add(item_id, vector)
+    index.remove([1, 2, 3])
+    assert [item_id for item_id, _ in index.search(index.vector(4), k=3, exact=True)] == [4]
+
+
+@pytest.mark.parametrize("nprobe", [-20, -5, 0, 1, 10_000])
+def test_ivf_nprobe_is_clamped(index, nprobe):
+    index.build_ivf(nlist=16, m=8)
+    results = index.search(index.vector(42), k=3, exclude_id=42, nprobe=nprobe)
+    assert len(results) == 3
+
+
+@pytest.mark.parametrize("nprobe", [0, -5])
+def test_similar_endpoint_rejects_bad_nprobe(nprobe):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    # No `with`: startup never runs; validation answers before the handler
+    response = TestClient(main.app).get(f"/predictions/1/similar?nprobe={nprobe}")
+    assert response.status_code == 422
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+# Pixel offset for the shifted views
+TTA_SHIFT_PIXELS = int(os.getenv("TTA_SHIFT_PIXELS", "8"))
+
+# Views in the order they are generated; callers can ask for the first N
+TTA_VIEWS = [
+    "identity",
+    "flip_horizontal",
+    "flip_vertical",
+    "rotate_90",
+    "rotate_180",
+    "rotate_270",
+    "shift_up",
+    "shift_down",
+    "shift_left",
+    "shift_right",
+]
+
+
+def make_tta_batch(img_array, num_views=None, shift=TTA_SHIFT_PIXELS):
+    """
+    Build a (V, H, W, 3) batch of augmented views from the (1, H, W, 3)
+    array returned by `preprocess_image`.
+
+    Every view is a whole-array NumPy copy into one preallocated batch, so
+    the result can be scored in a single forward pass. Shifts use edge
+    padding rather than wrap-around so no opposite-border pixels leak in.
+    """
+    if num_views is None:
+        num_views = len(TTA_VIEWS)
+    if not 1 <= num_views <= len(TTA_VIEWS):
+        raise ValueError(f"num_views must be between 1 and {len(TTA_VIEWS)}, got {num_views}")
+    image = img_array[0]
+    height, width = image.shape[:2]
+
+    batch = np.empty((num_views, height, width, image.shape[2]), dtype=img_array.dtype)
+    padded = None
+    offsets = {
+        "shift_up": (2 * shift, shift),
+        "shift_down": (0, shift),
+        "shift_left": (shift, 2 * shift),
+        "shift_right": (shift, 0),
+    }
+
+    for i, view in enumerate(TTA_VIEWS[:num_views]):
+        if view == "identity":
+            batch[i] = image
+        elif view == "flip_horizontal":
+            batch[i] = image[:, ::-1]
+        elif view == "flip_vertical":
+            batch[i] = image[::-1]
+        elif view.startswith("rotate_"):
+            # Rotations keep the shape only for square inputs (224x224 here)
+            batch[i] = np.rot90(image, int(view.split("_")[1]) // 90)
+        else:
+            if padded is None:
+                padded = np.pad(image, ((shift, shift), (shift, shift), (0, 0)), mode="edge")
+            top, left = offsets[view]
+            batch[i] = padded[top:top + height, left:left + width]
+    return batch
+
+
+def summarize_scores(scores):
+    """Reduce per-view scores to the numbers returned by /predict."""
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    return {
+        "views": int(scores.size),
+        "mean_score": float(scores.mean()),
+        "variance": float(scores.var()),
+        "min_score": float(scores.min()),
+        "max_score": float(scores.max()),
+    }
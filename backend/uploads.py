@@ -0,0 +1,204 @@
+import os
+import struct
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# ========== Limits ==========
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Whole-request limit for /screen, which takes a series of DICOM slices
+MAX_SCREEN_UPLOAD_BYTES = int(os.getenv("MAX_SCREEN_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(4096 * 4096)))
+SNIFF_BYTES = 64 * 1024
+
+# ========== Request Body Limit ==========
+
+class UploadLimitMiddleware:
+    """
+    Reject oversized uploads while the body is still arriving.
+
+    A declared Content-Length over the limit is refused before a single body
+    byte is read; chunked or lying clients are cut off as soon as the running
+    total crosses the limit, instead of after the multipart parser has spooled
+    the whole thing. `limits` maps path -> max bytes.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if max_bytes is None:
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+            return await _send_too_large(send, max_bytes)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail=_too_large_detail(max_bytes))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _too_large_detail(max_bytes):
+    return f"Upload exceeds {_format_size(max_bytes)} limit"
+
+
+def _format_size(num_bytes):
+    """Human-readable size that doesn't round small limits down to "0 MB"."""
+    for unit, scale in (("MB", 1024 * 1024), ("KB", 1024)):
+        if num_bytes >= scale:
+            return f"{round(num_bytes / scale, 1):g} {unit}"
+    return f"{num_bytes} bytes"
+
+
+async def _send_too_large(send, max_bytes):
+    response = JSONResponse(status_code=413, content={"detail": _too_large_detail(max_bytes)})
+    await send({"type": "http.response.start", "status": 413, "headers": response.raw_headers})
+    await send({"type": "http.response.body", "body": response.body})
+
+# ========== Header Sniffing ==========
+
+# JPEG start-of-frame markers (DHT, JPG and DAC share the range but carry no size)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def sniff_image_header(head):
+    """
+    Identify an image from its leading bytes.
+
+    Returns (format, width, height) with PIL format names, or None for
+    anything we don't accept. Width/height are None for formats whose size
+    isn't in a fixed header position (TIFF) or lies past `head`.
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(head) >= 24 and head[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", head[16:24])
+            return "PNG", width, height
+        return "PNG", None, None
+    if head[:3] == b"\xff\xd8\xff":
+        return ("JPEG",) + _jpeg_size(head)
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        width, height = struct.unpack("<HH", head[6:10])
+        return "GIF", width, height
+    if head[:2] == b"BM" and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return "BMP", width, abs(height)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ("WEBP",) + _webp_size(head)
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "TIFF", None, None
+    return None
+
+
+def _jpeg_size(data):
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            break
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length
+            i += 2
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None, None
+
+
+def _webp_size(data):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None, None
+
+# ========== Validation & Decode ==========
+
+def inspect_upload(upload, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Validate an upload from its size and header bytes only.
+
+    Works on the SpooledTemporaryFile Starlette already wrote the part to,
+    so nothing is copied. Returns (format, size_bytes) and leaves the file
+    positioned at 0, ready for decoding.
+    """
+    fileobj = upload.file
+    size = _upload_size(fileobj, max_bytes)
+
+    head = fileobj.read(SNIFF_BYTES)
+    fileobj.seek(0)
+    info = sniff_image_header(head)
+    if info is None:
+        raise HTTPException(status_code=415, detail="Unsupported image format")
+
+    image_format, width, height = info
+    if width is not None:
+        _check_dimensions(width, height, max_pixels)
+    return image_format, size
+
+
+def inspect_dicom_upload(upload, max_bytes=MAX_UPLOAD_BYTES):
+    """Validate a DICOM Part 10 upload: size plus the DICM magic after the preamble."""
+    fileobj = upload.file
+    size = _upload_size(fileobj, max_bytes)
+    head = fileobj.read(132)
+    fileobj.seek(0)
+    if head[128:132] != b"DICM":
+        raise HTTPException(status_code=415, detail="Not a DICOM file")
+    return size
+
+
+def _upload_size(fileobj, max_bytes):
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    if size > max_bytes:
+        raise HTTPException(status_code=413, detail=_too_large_detail(max_bytes))
+    return size
+
+
+def open_image(fileobj, image_format, max_pixels=MAX_IMAGE_PIXELS):
+    """Open the upload in place, restricted to the sniffed decoder."""
+    from PIL import Image  # deferred until the first upload, off the startup path
+    
+    # Never let PIL decode something bigger than we would accept
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        image = Image.open(fileobj, formats=[image_format])
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+    # Covers formats whose size only PIL's header parser can find
+    _check_dimensions(image.width, image.height, max_pixels)
+    return image
+
+
+def _check_dimensions(width, height, max_pixels):
+    if width <= 0 or height <= 0:
+        raise HTTPException(status_code=400, detail="Invalid image dimensions")
+    if width * height > max_pixels:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image is {width}x{height}; maximum is {max_pixels} pixels"
+        )
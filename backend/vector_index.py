@@ -0,0 +1,456 @@
+"""
+Compact on-disk vector index for similar-case retrieval.
+
+Embeddings are L2-normalised and stored as float16 in a memory-mapped file
+next to the database, with a parallel int64 file of prediction ids, so the
+OS page cache (not the Python heap) holds the collection and several
+workers can share it. Search is brute-force cosine similarity in NumPy,
+chunked over the memmap; for large collections an IVF index with product
+quantisation (IVF-PQ) narrows the scan to a few coarse clusters and scores
+8-bit codes with lookup tables before an exact re-rank.
+
+Rows are never rewritten: when predictions are archived their rows are
+tombstoned in a parallel byte file and masked out of every search.
+
+    python vector_index.py build embeddings/v3 --nlist 1024 --m 16
+"""
+import argparse
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "embeddings")
+INITIAL_CAPACITY = 1024
+SEARCH_CHUNK_ROWS = 65536
+RERANK_FACTOR = 8
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _open_memmap(path, dtype, shape):
+    """Map `path` with `shape`, creating or extending the file as needed."""
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with open(path, "ab") as f:
+        if f.tell() < nbytes:
+            f.truncate(nbytes)
+    return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def index_directory(model_version, root=None):
+    """Where the index for a model version lives (one directory per version)."""
+    return os.path.join(root or EMBEDDING_DIR, os.path.basename(model_version or "default"))
+
+# ========== k-means ==========
+
+def _nearest(data, centroids):
+    """Index of the nearest centroid (L2) for every row, computed in chunks."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), SEARCH_CHUNK_ROWS):
+        block = np.asarray(data[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+        out[start:start + len(block)] = np.argmin(centroid_norms - 2.0 * block @ centroids.T, axis=1)
+    return out
+
+
+def _kmeans(data, k, iters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=len(data) < k)].astype(np.float32)
+    for _ in range(iters):
+        assign = _nearest(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0  # empty clusters keep their previous centroid
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+# ========== IVF-PQ ==========
+
+class IVFPQ:
+    """
+    Inverted-file coarse quantiser plus product-quantised residuals.
+
+    Each build writes its files under a new generation, so a retrain never
+    touches the structures that searches and appends are using.
+    """
+
+    FILES = ("ivf_centroids.npy", "pq_codebooks.npy", "ivf_order.npy", "ivf_offsets.npy",
+             "ivf_lists.i32", "pq_codes.u8")
+
+    def __init__(self, directory, centroids, codebooks, built_count, order, offsets, capacity, generation=None):
+        self.directory = directory
+        self.generation = generation
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.nlist = len(centroids)
+        self.m, _, self.sub_dim = codebooks.shape
+        self.built_count = built_count
+        self.order = order
+        self.offsets = offsets
+        self.map(capacity)
+
+    @staticmethod
+    def file_path(directory, name, generation):
+        """ivf_lists.i32 -> ivf_lists.g3.i32 (indexes built before generations use the bare names)."""
+        if generation is None:
+            return os.path.join(directory, name)
+        stem, ext = os.path.splitext(name)
+        return os.path.join(directory, f"{stem}.g{generation}{ext}")
+
+    def path(self, name):
+        return self.file_path(self.directory, name, self.generation)
+
+    def map(self, capacity):
+        self.lists = _open_memmap(self.path("ivf_lists.i32"), np.int32, (capacity,))
+        self.codes = _open_memmap(self.path("pq_codes.u8"), np.uint8, (capacity, self.m))
+
+    def remove_files(self):
+        for name in self.FILES:
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def train(cls, directory, vectors, count, capacity, nlist, m, train_size=100_000, seed=0, generation=None):
+        """Train on and encode the first `count` rows of `vectors`."""
+        dim = vectors.shape[1]
+        if dim % m:
+            raise ValueError(f"Embedding dim {dim} is not divisible by m={m}")
+        nlist = min(nlist, count)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, min(train_size, count), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+        centroids = _kmeans(sample, nlist, seed=seed)
+        residuals = sample - centroids[_nearest(sample, centroids)]
+        sub_dim = dim // m
+        codebooks = np.stack([
+            _kmeans(residuals[:, j * sub_dim:(j + 1) * sub_dim], 256, seed=seed + j)
+            for j in range(m)
+        ])
+
+        ivf = cls(directory, centroids, codebooks, 0, np.empty(0, np.int64),
+                  np.zeros(nlist + 1, np.int64), capacity, generation)
+        np.save(ivf.path("ivf_centroids.npy"), centroids)
+        np.save(ivf.path("pq_codebooks.npy"), codebooks)
+
+        for start in range(0, count, SEARCH_CHUNK_ROWS):
+            block = np.asarray(vectors[start:min(start + SEARCH_CHUNK_ROWS, count)], dtype=np.float32)
+            ivf.encode(start, block)
+
+        # Rows grouped by list so a probe reads one contiguous slice of `order`
+        ivf.built_count = count
+        ivf.order = np.argsort(ivf.lists[:count], kind="stable").astype(np.int64)
+        ivf.offsets = np.concatenate([[0], np.cumsum(np.bincount(ivf.lists[:count], minlength=nlist))])
+        np.save(ivf.path("ivf_order.npy"), ivf.order)
+        np.save(ivf.path("ivf_offsets.npy"), ivf.offsets)
+        return ivf
+
+    @classmethod
+    def load(cls, directory, meta, capacity):
+        generation = meta.get("generation")
+        path = lambda name: cls.file_path(directory, name, generation)
+        return cls(
+            directory,
+            np.load(path("ivf_centroids.npy")),
+            np.load(path("pq_codebooks.npy")),
+            meta["built_count"],
+            np.load(path("ivf_order.npy"), mmap_mode="r"),
+            np.load(path("ivf_offsets.npy")),
+            capacity,
+            generation,
+        )
+
+    def meta(self):
+        return {"nlist": self.nlist, "m": self.m, "built_count": self.built_count, "generation": self.generation}
+
+    def encode(self, start, block):
+        """Assign rows to lists and store their PQ codes."""
+        assign = _nearest(block, self.centroids)
+        residuals = block - self.centroids[assign]
+        codes = np.empty((len(block), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            codes[:, j] = _nearest(sub, self.codebooks[j])
+        self.lists[start:start + len(block)] = assign
+        self.codes[start:start + len(block)] = codes
+
+    def candidates(self, query, count, nprobe):
+        """Approximate inner-product scores for rows in the `nprobe` nearest lists."""
+        nprobe = max(1, min(nprobe, self.nlist))
+        coarse = (self.centroids ** 2).sum(axis=1) - 2.0 * self.centroids @ query
+        probe = np.argpartition(coarse, nprobe - 1)[:nprobe]
+
+        rows = [self.order[self.offsets[p]:self.offsets[p + 1]] for p in probe]
+        if count > self.built_count:
+            # Rows added since the last build aren't in `order` yet
+            tail = np.arange(self.built_count, count)
+            rows.append(tail[np.isin(self.lists[self.built_count:count], probe)])
+        rows = np.concatenate(rows) if rows else np.empty(0, np.int64)
+        if rows.size == 0:
+            return rows, np.empty(0, np.float32)
+
+        # score = q.c + sum_j q_j.codebook_j[code_j], via one lookup table per subspace
+        lut = np.einsum("jcd,jd->jc", self.codebooks, query.reshape(self.m, self.sub_dim))
+        codes = np.asarray(self.codes[rows])
+        approx = (self.centroids[self.lists[rows]] @ query) + lut[np.arange(self.m), codes].sum(axis=1)
+        return rows, approx.astype(np.float32)
+
+# ========== Index ==========
+
+class VectorIndex:
+    """Append-only float16 embedding store keyed by prediction id, with tombstones."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self.vectors = None
+        self.ids = None
+        self.removed = None
+        self.removed_count = 0
+        self.ivf = None
+        self._meta_mtime = None
+        self._load()
+
+    # ---------- persistence ----------
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        self._meta_mtime = os.stat(self.meta_path).st_mtime_ns
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.removed_count = meta.get("removed", 0)
+        if meta["capacity"] != self.capacity:
+            self._map(meta["capacity"])
+        if meta.get("ivf"):
+            if self.ivf is None or self.ivf.generation != meta["ivf"].get("generation"):
+                self.ivf = IVFPQ.load(self.directory, meta["ivf"], self.capacity)
+        else:
+            self.ivf = None
+
+    def _map(self, capacity):
+        self.capacity = capacity
+        self.vectors = _open_memmap(os.path.join(self.directory, "vectors.f16"),
+                                    np.float16, (capacity, self.dim))
+        self.ids = _open_memmap(os.path.join(self.directory, "ids.i64"), np.int64, (capacity,))
+        # 1 = row's prediction was archived; indexes from before tombstones get a zeroed file
+        self.removed = _open_memmap(os.path.join(self.directory, "removed.u8"), np.uint8, (capacity,))
+        if self.ivf is not None:
+            self.ivf.map(capacity)
+
+    def _write_meta(self):
+        meta = {
+            "dim": self.dim,
+            "count": self.count,
+            "capacity": self.capacity,
+            "removed": self.removed_count,
+            "dtype": "float16",
+            "ivf": self.ivf.meta() if self.ivf else None,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        self._meta_mtime = os.stat(self.meta_path).st_mtime_ns
+
+    def refresh(self):
+        """Pick up rows appended by other worker processes."""
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._meta_mtime:
+            self._load()
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.directory, "index.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---------- writes ----------
+
+    def add(self, item_id, vector):
+        vector = _normalize(vector)
+        with self._locked():
+            if self.dim is None:
+                self.dim = len(vector)
+                self._map(INITIAL_CAPACITY)
+            if len(vector) != self.dim:
+                raise ValueError(f"Expected {self.dim}-dim embedding, got {len(vector)}")
+            if self.count == self.capacity:
+                self._map(self.capacity * 2)
+
+            row = self.count
+            self.vectors[row] = vector
+            self.ids[row] = item_id
+            if self.ivf is not None:
+                self.ivf.encode(row, vector[None, :])
+            self.count += 1
+            self._write_meta()
+
+    def remove(self, item_ids):
+        """Tombstone the rows of these ids so searches skip them; returns how many were live."""
+        item_ids = np.asarray(list(item_ids), dtype=np.int64)
+        if item_ids.size == 0:
+            return 0
+        with self._locked():
+            if self.count == 0:
+                return 0
+            rows = np.flatnonzero(np.isin(self.ids[:self.count], item_ids))
+            rows = rows[self.removed[rows] == 0]
+            if rows.size:
+                self.removed[rows] = 1
+                self.removed_count += int(rows.size)
+                self._write_meta()
+        return int(rows.size)
+
+    def build_ivf(self, nlist=1024, m=16, train_size=100_000):
+        """
+        Train (or retrain) the IVF-PQ structures over everything indexed so far.
+
+        Training runs on the rows present at the start without holding the
+        index lock, so add() keeps going meanwhile. The new generation is
+        swapped in under the lock after encoding the rows appended during
+        training. Raises RuntimeError if another build is running.
+        """
+        with open(os.path.join(self.directory, "build.lock"), "w") as build_lock:
+            try:
+                fcntl.flock(build_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError("An IVF-PQ build is already running for this index")
+
+            with self._locked():
+                if self.count == 0:
+                    raise ValueError("Index is empty")
+                # Rows below `count` never change, and this mapping stays valid if add() remaps
+                count, vectors, capacity, previous = self.count, self.vectors, self.capacity, self.ivf
+            generation = (previous.generation or 0) + 1 if previous else 1
+            ivf = IVFPQ.train(self.directory, vectors, count, capacity, nlist, m, train_size,
+                              generation=generation)
+
+            with self._locked():
+                ivf.map(self.capacity)
+                if self.count > count:
+                    ivf.encode(count, np.asarray(self.vectors[count:self.count], dtype=np.float32))
+                self.ivf = ivf
+                self._write_meta()
+            if previous is not None:
+                previous.remove_files()
+        return ivf.meta()
+
+    # ---------- reads ----------
+
+    def vector(self, item_id):
+        """Stored (normalised) embedding for an id, or None."""
+        self.refresh()
+        if self.count == 0:
+            return None
+        ids = self.ids[:self.count]
+        # Ids are appended in commit order, so they are (almost always) sorted
+        row = int(np.searchsorted(ids, item_id))
+        if row >= self.count or ids[row] != item_id:
+            matches = np.flatnonzero(ids == item_id)
+            if matches.size == 0:
+                return None
+            row = int(matches[0])
+        return np.asarray(self.vectors[row], dtype=np.float32)
+
+    def search(self, query, k=5, exclude_id=None, nprobe=16, exact=False):
+        """Top-k (id, cosine similarity) pairs, best first."""
+        self.refresh()
+        if self.count == 0:
+            return []
+        query = _normalize(query)
+        want = k + (1 if exclude_id is not None else 0)
+
+        if self.ivf is not None and not exact:
+            rows, approx = self.ivf.candidates(query, self.count, nprobe)
+            live = self.removed[rows] == 0
+            rows, approx = rows[live], approx[live]
+            # Re-rank the best approximate hits with the exact float16 vectors
+            shortlist = rows[_top_k(approx, want * RERANK_FACTOR)]
+            sims = np.asarray(self.vectors[np.sort(shortlist)], dtype=np.float32) @ query
+            shortlist = np.sort(shortlist)
+        else:
+            shortlist, sims = self._search_exact(query, want)
+
+        results = []
+        for i in _top_k(sims, want):
+            if sims[i] == -np.inf:
+                break  # fewer live rows than asked for
+            item_id = int(self.ids[shortlist[i]])
+            if item_id != exclude_id:
+                results.append((item_id, float(sims[i])))
+        return results[:k]
+
+    def _search_exact(self, query, k):
+        best_rows = np.empty(0, dtype=np.int64)
+        best_sims = np.empty(0, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_CHUNK_ROWS):
+            stop = min(start + SEARCH_CHUNK_ROWS, self.count)
+            sims = np.asarray(self.vectors[start:stop], dtype=np.float32) @ query
+            if self.removed_count:
+                sims[self.removed[start:stop] != 0] = -np.inf
+            top = _top_k(sims, k)
+            best_rows = np.concatenate([best_rows, top + start])
+            best_sims = np.concatenate([best_sims, sims[top]])
+        return best_rows, best_sims
+
+    def stats(self):
+        self.refresh()
+        return {
+            "count": self.count,
+            "removed": self.removed_count,
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "bytes_on_disk": self.capacity * (self.dim or 0) * 2,
+            "ivf": self.ivf.meta() if self.ivf else None,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage an embedding index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Train IVF-PQ over an existing index")
+    build.add_argument("directory")
+    build.add_argument("--nlist", type=int, default=1024)
+    build.add_argument("--m", type=int, default=16)
+    build.add_argument("--train-size", type=int, default=100_000)
+    stats = sub.add_parser("stats", help="Show index size")
+    stats.add_argument("directory")
+    args = parser.parse_args()
+
+    index = VectorIndex(args.directory)
+    if args.command == "build":
+        print(f"Training IVF-PQ over {index.count} vectors...")
+        print(f"✅ {index.build_ivf(args.nlist, args.m, args.train_size)}")
+    else:
+        print(index.stats())
@@ -3,6 +3,7 @@ import axios from 'axios';
 import './App.css';
 
 const API_BASE_URL = 'https://oncodetect-backend-edison.onrender.com';
+const HISTORY_LIMIT = 5;
 
 function App() {
   const [selectedFile, setSelectedFile] = useState(null);
@@ -12,15 +13,39 @@ function App() {
   const [history, setHistory] = useState([]);
   const [stats, setStats] = useState(null);
 
-  // Load history and stats on mount
+  // Live history and stats: the server pushes a snapshot on connect and
+  // every new prediction after that (EventSource reconnects by itself)
   useEffect(() => {
-    fetchHistory();
-    fetchStats();
+    if (!window.EventSource) {
+      fetchHistory();
+      fetchStats();
+      return undefined;
+    }
+
+    const events = new EventSource(`${API_BASE_URL}/events`);
+    events.addEventListener('snapshot', (event) => {
+      const data = JSON.parse(event.data);
+      setHistory(data.predictions.slice(0, HISTORY_LIMIT));
+      setStats(data.stats);
+    });
+    events.addEventListener('prediction', (event) => {
+      const data = JSON.parse(event.data);
+      addToHistory(data.prediction);
+      setStats(data.stats);
+    });
+    return () => events.close();
   }, []);
 
+  const addToHistory = (item) => {
+    setHistory((current) => [
+      item,
+      ...current.filter((existing) => existing.id !== item.id),
+    ].slice(0, HISTORY_LIMIT));
+  };
+
   const fetchHistory = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/predictions?limit=5`);
+      const response = await axios.get(`${API_BASE_URL}/predictions?limit=${HISTORY_LIMIT}`);
       setHistory(response.data.predictions);
     } catch (error) {
       console.error('Error fetching history:', error);
@@ -69,7 +94,16 @@ function App() {
       });
 
       setResult(response.data);
-      fetchHistory();
+      // The event stream may be served by another worker; show our own result right away
+      addToHistory({
+        id: response.data.prediction_id,
+        timestamp: response.data.timestamp,
+        filename: response.data.filename,
+        prediction: response.data.prediction,
+        confidence: response.data.confidence,
+        model_version: response.data.model_version,
+      });
+      // Counters on the stream only catch up with other workers at the next resync
       fetchStats();
     } catch (error) {
       console.error('Error uploading file:', error);
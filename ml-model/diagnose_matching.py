@@ -1,6 +1,6 @@
 import os
-import pydicom
 import xml.etree.ElementTree as ET
+from volume_cache import load_series
 
 RAW_DATA_PATH = 'raw_data/LIDC-IDRI'
 
@@ -34,17 +34,11 @@ for root, dirs, files in os.walk(patient_path):
         
         print(f"XML references {len(xml_uids)} unique slice UIDs")
         
-        # Get all UIDs from DICOM files
-        dcm_uids = set()
-        for dcm_file in dcm_files[:50]:  # Sample first 50
-            try:
-                ds = pydicom.dcmread(os.path.join(root, dcm_file))
-                if hasattr(ds, 'SOPInstanceUID'):
-                    dcm_uids.add(ds.SOPInstanceUID)
-            except:
-                pass
-        
-        print(f"DICOM files contain {len(dcm_uids)} unique UIDs (sampled 50 files)")
+        # Get all UIDs from DICOM files (cached after the first run)
+        series = load_series(root)
+        dcm_uids = set(series.uids) if series is not None else set()
+        
+        print(f"DICOM files contain {len(dcm_uids)} unique UIDs")
         
         # Check overlap
         matches = xml_uids.intersection(dcm_uids)
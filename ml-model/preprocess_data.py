@@ -1,11 +1,11 @@
 # preprocess_data.py (Version 2 - More Robust)
 
 import os
-import pydicom
 import xml.etree.ElementTree as ET
 import cv2
 import numpy as np
 from tqdm import tqdm
+from volume_cache import load_series
 
 # --- CONFIGURATION ---
 RAW_DATA_PATH = 'raw_data/LIDC-IDRI' 
@@ -66,12 +66,8 @@ def process_scan_v2(scan_path):
         nodule_annotations = parse_xml_annotations_v2(xml_path)
         
         # *** KEY CHANGE #2: Create a dictionary mapping slice UID to its image data ***
-        dicom_files = [f for f in os.listdir(scan_path) if f.endswith('.dcm')]
-        slices = {}
-        for dcm_file in dicom_files:
-            dcm_path = os.path.join(scan_path, dcm_file)
-            ds = pydicom.dcmread(dcm_path)
-            slices[ds.SOPInstanceUID] = ds.pixel_array
+        series = load_series(scan_path)
+        slices = series.by_uid(hu=False) if series is not None else {}
 
         processed_nodules = []
         for nodule in nodule_annotations:
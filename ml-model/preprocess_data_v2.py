@@ -1,11 +1,11 @@
 # preprocess_data_v2.py - Improved with SOPInstanceUID matching
 
 import os
-import pydicom
 import xml.etree.ElementTree as ET
 import cv2
 import numpy as np
 from tqdm import tqdm
+from volume_cache import load_series
 
 # --- CONFIGURATION ---
 RAW_DATA_PATH = 'raw_data/LIDC-IDRI' 
@@ -94,18 +94,9 @@ def process_scan_v2(scan_path):
         if not nodule_annotations:
             return []
         
-        # Build dictionary mapping SOPInstanceUID to pixel data
-        dicom_files = [f for f in os.listdir(scan_path) if f.endswith('.dcm')]
-        slices = {}
-        
-        for dcm_file in dicom_files:
-            dcm_path = os.path.join(scan_path, dcm_file)
-            try:
-                ds = pydicom.dcmread(dcm_path)
-                if hasattr(ds, 'SOPInstanceUID'):
-                    slices[ds.SOPInstanceUID] = ds.pixel_array
-            except Exception:
-                continue
+        # Mapping of SOPInstanceUID to pixel data (decoded once, then memory-mapped)
+        series = load_series(scan_path)
+        slices = series.by_uid(hu=False) if series is not None else {}
 
         processed_nodules = []
         
@@ -1,9 +1,9 @@
 import os
-import pydicom
 import xml.etree.ElementTree as ET
 import cv2
 import numpy as np
 from tqdm import tqdm
+from volume_cache import load_patient
 
 RAW_DATA_PATH = 'raw_data/LIDC-IDRI' 
 OUTPUT_PATH = 'processed_data_v3'
@@ -63,21 +63,15 @@ def parse_xml_annotations(xml_path):
 
 
 def process_patient_all_scans(patient_folder):
-    all_slices = {}
     xml_files = []
     
     for root, dirs, files in os.walk(patient_folder):
         for f in files:
             if f.endswith('.xml'):
                 xml_files.append(os.path.join(root, f))
-            elif f.endswith('.dcm'):
-                try:
-                    dcm_path = os.path.join(root, f)
-                    ds = pydicom.dcmread(dcm_path)
-                    if hasattr(ds, 'SOPInstanceUID'):
-                        all_slices[ds.SOPInstanceUID] = ds.pixel_array
-                except:
-                    pass
+    
+    # Raw stored pixel values, same as ds.pixel_array, served from the volume cache
+    all_slices = load_patient(patient_folder, hu=False)
     
     if not xml_files or not all_slices:
         return []
@@ -1,8 +1,8 @@
 import os
-import pydicom
 import xml.etree.ElementTree as ET
 import cv2
 import numpy as np
+from volume_cache import load_patient
 
 RAW_DATA_PATH = 'raw_data/LIDC-IDRI'
 CROP_SIZE = 64
@@ -14,26 +14,17 @@ patient_folder = os.path.join(RAW_DATA_PATH, test_patient)
 print(f"Testing on: {test_patient}")
 print("="*60)
 
-# Build master dictionary
-all_slices = {}
+# Build master dictionary (decoded once, memory-mapped on later runs)
 xml_path = None
 
-print("Scanning all folders for DICOM and XML files...")
+print("Scanning all folders for XML files...")
 for root, dirs, files in os.walk(patient_folder):
     for f in files:
         if f.endswith('.xml'):
             xml_path = os.path.join(root, f)
             print(f"Found XML: {xml_path}")
-    
-    for f in files:
-        if f.endswith('.dcm'):
-            try:
-                dcm_path = os.path.join(root, f)
-                ds = pydicom.dcmread(dcm_path)
-                if hasattr(ds, 'SOPInstanceUID'):
-                    all_slices[ds.SOPInstanceUID] = ds.pixel_array
-            except:
-                pass
+
+all_slices = load_patient(patient_folder)
 
 print(f"\nTotal DICOM slices loaded: {len(all_slices)}")
 
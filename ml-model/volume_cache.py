@@ -0,0 +1,236 @@
+# volume_cache.py - Decode each DICOM series once, memory-map it afterwards
+
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+import pydicom
+
+CACHE_DIR = os.getenv('VOLUME_CACHE_DIR', 'volume_cache')
+CACHE_BUDGET_BYTES = int(float(os.getenv('VOLUME_CACHE_BUDGET_GB', '20')) * 1024 ** 3)
+# Bumped when the on-disk layout changes; older entries are re-decoded
+CACHE_FORMAT = 2
+
+
+class CachedSeries:
+    """
+    One decoded series: a (slices, rows, cols) volume of the stored pixel
+    values exactly as ds.pixel_array returned them, memory-mapped
+    read-only, plus per-slice UID, z-position and the rescale parameters
+    that turn them into Hounsfield units.
+    """
+
+    def __init__(self, entry_dir, meta):
+        self.entry_dir = entry_dir
+        self.source = meta['source']
+        self.uids = meta['uids']
+        self.z_positions = np.array(meta['z_positions'], dtype=np.float64)
+        self.slopes = np.array(meta['slopes'], dtype=np.float64)
+        self.intercepts = np.array(meta['intercepts'], dtype=np.float64)
+        self.volume = np.load(os.path.join(entry_dir, 'volume.npy'), mmap_mode='r')
+        self.index = {uid: i for i, uid in enumerate(self.uids)}
+
+    def __len__(self):
+        return len(self.uids)
+
+    def slice(self, uid, hu=True):
+        """
+        2D slice for a SOPInstanceUID. hu=False gives the stored pixel values
+        (what ds.pixel_array returned) as a zero-copy view; hu=True rescales
+        them: int32 for integral slope/intercept (the usual CT case), else float32.
+        """
+        i = self.index[uid]
+        pixels = self.volume[i]
+        if not hu:
+            return pixels
+        slope, intercept = self.slopes[i], self.intercepts[i]
+        if slope.is_integer() and intercept.is_integer():
+            return pixels.astype(np.int32) * int(slope) + int(intercept)
+        return pixels.astype(np.float32) * np.float32(slope) + np.float32(intercept)
+
+    def by_uid(self, hu=True):
+        return SliceMap([self], hu)
+
+
+class SliceMap(Mapping):
+    """Read-only UID -> slice mapping across one or more cached series."""
+
+    def __init__(self, series, hu=True):
+        self.series = series
+        self.hu = hu
+        self._owner = {}
+        for s in series:
+            for uid in s.uids:
+                self._owner.setdefault(uid, s)
+
+    def __getitem__(self, uid):
+        return self._owner[uid].slice(uid, self.hu)
+
+    def __contains__(self, uid):
+        return uid in self._owner
+
+    def __iter__(self):
+        return iter(self._owner)
+
+    def __len__(self):
+        return len(self._owner)
+
+
+def _fingerprint(paths):
+    """Changes whenever a source file is added, removed, rewritten or touched."""
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _decode_series(paths):
+    """Read every slice and stack the stored values by z-position (no rescaling, so nothing is lost)."""
+    slices = []
+    for path in paths:
+        try:
+            ds = pydicom.dcmread(path)
+            if not hasattr(ds, 'SOPInstanceUID'):
+                continue
+            pixels = ds.pixel_array
+        except Exception:
+            continue
+        slope = float(getattr(ds, 'RescaleSlope', 1) or 1)
+        intercept = float(getattr(ds, 'RescaleIntercept', 0) or 0)
+        position = getattr(ds, 'ImagePositionPatient', None)
+        z = float(position[2]) if position is not None else float(getattr(ds, 'InstanceNumber', 0) or 0)
+        slices.append((z, str(ds.SOPInstanceUID), slope, intercept, pixels))
+
+    if not slices:
+        return None, []
+
+    # Scouts/localizers can share a folder with the axial series; keep the dominant shape
+    shapes = [s[4].shape for s in slices]
+    shape = max(set(shapes), key=shapes.count)
+    slices = sorted((s for s in slices if s[4].shape == shape), key=lambda s: s[0])
+
+    # A dtype that holds every slice exactly (int16 or uint16 for CT; int32 if a series mixes them)
+    volume = np.empty((len(slices), *shape), dtype=np.result_type(*(s[4].dtype for s in slices)))
+    for i, (_, _, _, _, pixels) in enumerate(slices):
+        volume[i] = pixels
+    return volume, slices
+
+
+def _entry_size(entry_dir):
+    return sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+
+
+def enforce_budget(cache_dir=CACHE_DIR, budget_bytes=CACHE_BUDGET_BYTES, keep=()):
+    """Evict least-recently-used entries until the cache fits the budget."""
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if not entry.is_dir():
+            continue
+        marker = os.path.join(entry.path, 'last_used')
+        # Entries left without a marker (e.g. by a crash) still age by their directory
+        last_used = os.stat(marker if os.path.exists(marker) else entry.path).st_mtime
+        entries.append((last_used, entry.name, entry.path, _entry_size(entry.path)))
+
+    total = sum(e[3] for e in entries)
+    for _, name, path, size in sorted(entries):
+        if total <= budget_bytes:
+            break
+        if name in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def load_series(series_folder, cache_dir=CACHE_DIR, budget_bytes=CACHE_BUDGET_BYTES):
+    """
+    Return the CachedSeries for a folder of .dcm files, decoding it only if
+    the cache is missing or the source files changed. Returns None if the
+    folder holds no readable slices.
+    """
+    paths = sorted(
+        os.path.join(series_folder, f) for f in os.listdir(series_folder) if f.endswith('.dcm')
+    )
+    if not paths:
+        return None
+
+    source = os.path.abspath(series_folder)
+    key = hashlib.sha1(source.encode()).hexdigest()[:16]
+    entry_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry_dir, 'meta.json')
+    marker = os.path.join(entry_dir, 'last_used')
+    fingerprint = _fingerprint(paths)
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('format') == CACHE_FORMAT and meta.get('fingerprint') == fingerprint:
+            open(marker, 'a').close()  # recreate it if it went missing
+            os.utime(marker)
+            return CachedSeries(entry_dir, meta)
+
+    volume, slices = _decode_series(paths)
+    if volume is None:
+        return None
+
+    os.makedirs(entry_dir, exist_ok=True)
+    # Per-process temp names: two scripts may decode the same series at once
+    tmp_volume = os.path.join(entry_dir, f'volume.{os.getpid()}.tmp.npy')
+    np.save(tmp_volume, volume)
+    os.replace(tmp_volume, os.path.join(entry_dir, 'volume.npy'))
+
+    meta = {
+        'format': CACHE_FORMAT,
+        'source': source,
+        'fingerprint': fingerprint,
+        'shape': list(volume.shape),
+        'uids': [s[1] for s in slices],
+        'z_positions': [s[0] for s in slices],
+        'slopes': [s[2] for s in slices],
+        'intercepts': [s[3] for s in slices],
+    }
+    # The marker goes first: a published meta.json always has one
+    open(marker, 'w').close()
+    tmp_meta = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_meta, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+
+    enforce_budget(cache_dir, budget_bytes, keep=(key,))
+    return CachedSeries(entry_dir, meta)
+
+
+def load_patient(patient_folder, hu=True, **kwargs):
+    """
+    UID -> slice mapping for every DICOM series under a patient folder,
+    a drop-in for the `{ds.SOPInstanceUID: ds.pixel_array}` dicts the
+    preprocessing scripts used to build by hand (pass hu=False for exactly
+    those stored pixel values).
+    """
+    series = []
+    for root, dirs, files in os.walk(patient_folder):
+        if any(f.endswith('.dcm') for f in files):
+            cached = load_series(root, **kwargs)
+            if cached is not None:
+                series.append(cached)
+    return SliceMap(series, hu)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Warm or inspect the DICOM volume cache")
+    parser.add_argument('folders', nargs='+', help="Patient or series folders to cache")
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        start = time.perf_counter()
+        slices = load_patient(folder)
+        print(f"{folder}: {len(slices)} slices in {len(slices.series)} series "
+              f"({time.perf_counter() - start:.2f}s)")